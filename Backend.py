@@ -12,6 +12,7 @@ import csv
 import ipaddress
 import os
 import glob
+import fnmatch
 import threading
 import time
 import re
@@ -43,6 +44,11 @@ MODULE_CONFIG_RETENTION_DAYS = 0
 AGENT_SCAN_RETENTION_DAYS = 180
 
 MODULES_DIR = os.path.join(BASE_DIR, "Modules")
+# The json_store rows are encoded/decoded with the same helpers the modules use.
+SHARED_DIR = os.path.join(MODULES_DIR, "_shared")
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+from sqlite_store import dumps_json, loads_json
 TEMPLATES_DIR = os.path.join(BASE_DIR, "Templates")
 STATIC_DIR = os.path.join(BASE_DIR, "Static")
 OUI_RANGES_FILE = os.path.join(MODULES_DIR, "mikrotik_mac_discovery", "oui_ranges.txt")
@@ -50,6 +56,7 @@ OUI_DEVICE_TYPES_FILE = os.path.join(MODULES_DIR, "enforce_oui_table", "oui_devi
 ALLOWED_WEB_IPS_FILE = os.path.join(BASE_DIR, "allowed_web_ips.txt")
 AUDIT_LOG_DIR = os.path.join(BASE_DIR, "audit_logs")
 AUDIT_LOG_RETENTION_DAYS = 14
+JSON_IO_BUFFER_SIZE = 1024 * 1024
 
 GENERATED_MAPS_DIR = os.path.join(BASE_DIR, "generated_maps")
 AGENT_CONFIG_DIR = os.path.join(BASE_DIR, "share", "agent_configs")
@@ -275,12 +282,12 @@ def _read_sqlite_json(name: str):
         conn.close()
         if not row:
             return None
-        return json.loads(row[0])
+        return loads_json(row[0])
     except Exception:
         return None
 
 def _write_sqlite_json(name: str, data):
-    payload = json.dumps(data)
+    payload = dumps_json(data)
     now = datetime.now().isoformat()
     conn = _get_sqlite_conn()
     conn.execute(
@@ -302,8 +309,9 @@ def _read_json_file(path: str, default=None):
 
 def _write_json_file(path: str, data):
     try:
-        with portalocker.Lock(path, 'w', timeout=5, encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        payload = json.dumps(data, indent=2)
+        with portalocker.Lock(path, 'w', timeout=5, encoding='utf-8', buffering=JSON_IO_BUFFER_SIZE) as f:
+            f.write(payload)
     except Exception:
         pass
 
@@ -515,14 +523,14 @@ def _sync_sqlite_from_legacy_files():
         _write_sqlite_json("settings", legacy_settings)
 
 def init_database():
-    """Initialize empty database if it doesn't exist"""
+    """Initialize empty database if it doesn't exist and return its contents"""
     existing = _read_sqlite_json("devices")
     if existing is not None:
-        return
+        return existing
     legacy = _read_legacy_database_with_salvage()
     if legacy is not None:
         _write_sqlite_json("devices", legacy)
-        return
+        return legacy
     data = {
         "version": "1.0",
         "meta": {
@@ -534,6 +542,7 @@ def init_database():
         "discovery_sessions": []
     }
     _write_sqlite_json("devices", data)
+    return data
 
 DEFAULT_SETTINGS = {
     "default_site": "",
@@ -557,16 +566,17 @@ DEFAULT_SETTINGS = {
 }
 
 def init_settings():
-    """Initialize default settings"""
+    """Initialize default settings and return the stored settings"""
     existing = _read_sqlite_json("settings")
     if existing is not None:
-        return
+        return existing
     legacy = _read_json_file(SETTINGS_FILE, default=None)
     if legacy is not None:
         _write_sqlite_json("settings", legacy)
-        return
+        return legacy
     settings = DEFAULT_SETTINGS.copy()
     _write_sqlite_json("settings", settings)
+    return settings
 
 def _log_perf(label, start_time):
     duration = time.perf_counter() - start_time
@@ -581,14 +591,7 @@ def read_database():
     if legacy is not None:
         _write_sqlite_json("devices", legacy)
         return legacy
-    init_database()
-    return _read_sqlite_json("devices") or {
-        "version": "1.0",
-        "meta": {"created": datetime.now().isoformat(), "last_modified": datetime.now().isoformat()},
-        "sites": [],
-        "devices": [],
-        "discovery_sessions": []
-    }
+    return init_database()
 
 
 def write_database(data):
@@ -609,8 +612,7 @@ def read_settings():
             loaded = legacy
             _write_sqlite_json("settings", legacy)
         else:
-            init_settings()
-            loaded = _read_sqlite_json("settings") or {}
+            loaded = init_settings()
 
     merged = DEFAULT_SETTINGS.copy()
     if isinstance(loaded, dict):
@@ -724,7 +726,7 @@ def _write_agent_config_files(agent, settings):
     txt_path = os.path.join(AGENT_CONFIG_DIR, f"{agent.get('id')}.txt")
     try:
         with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=2)
+            f.write(json.dumps(config, indent=2))
     except Exception:
         pass
     try:
@@ -763,13 +765,14 @@ def _write_agent_scan_files(agent, scan_time, devices):
     csv_path = os.path.join(out_dir, f"{safe_site}_{ts}.csv")
 
     try:
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump({
-                "agent_id": agent_id,
-                "site": site,
-                "scan_time": scan_time,
-                "devices": devices
-            }, f, indent=2)
+        payload = json.dumps({
+            "agent_id": agent_id,
+            "site": site,
+            "scan_time": scan_time,
+            "devices": devices
+        }, indent=2)
+        with open(json_path, "w", encoding="utf-8", buffering=JSON_IO_BUFFER_SIZE) as f:
+            f.write(payload)
     except Exception:
         pass
 
@@ -3664,10 +3667,26 @@ def get_map_for_site(site_name):
         safe_site = _safe_site_name(site_name)
         safe_site_raw = "".join(ch for ch in str(site_name) if ch.isalnum() or ch in ("-", "_")).strip()
 
-        def _find_latest(patterns):
+        def _find_latest(patterns):
+            # The patterns only wildcard the file name and share three folders, so
+            # list each folder once and match names in memory instead of globbing per pattern.
+            listings = {}
             candidates = []
             for pattern in patterns:
-                candidates.extend(glob.glob(pattern))
+                dirname, basename = os.path.split(pattern)
+                if any(ch in dirname for ch in "*?["):
+                    candidates.extend(glob.glob(pattern))
+                    continue
+                if dirname not in listings:
+                    try:
+                        with os.scandir(dirname or ".") as entries:
+                            listings[dirname] = [entry.name for entry in entries]
+                    except OSError:
+                        listings[dirname] = []
+                names = listings[dirname]
+                if not basename.startswith("."):
+                    names = [name for name in names if not name.startswith(".")]
+                candidates.extend(os.path.join(dirname, name) for name in fnmatch.filter(names, basename))
             if not candidates:
                 return None
             candidates.sort(key=lambda p: os.path.getmtime(p), reverse=True)
@@ -3,6 +3,33 @@ import os
 import sqlite3
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads_json(text):
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # json.dumps rows may hold NaN/Infinity or lone surrogates that orjson rejects
+            pass
+    return json.loads(text)
+
+
+def dumps_json(data, default=None) -> str:
+    # orjson stores NaN/Infinity as null where json.dumps wrote NaN/Infinity;
+    # nothing in the store is expected to hold non-finite floats.
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+    # ASCII-escaped, so lone surrogates orjson refuses still fit the TEXT column.
+    return json.dumps(data, default=default)
+
 
 def _get_conn(db_path: str) -> sqlite3.Connection:
     if not db_path:
@@ -26,7 +53,7 @@ def read_json_store(db_path: str, name: str, default=None):
         conn.close()
         if not row:
             return default
-        return json.loads(row[0])
+        return loads_json(row[0])
     except Exception:
         return default
 
@@ -382,11 +409,11 @@ def write_json_store(db_path: str, name: str, data, merge: bool = True) -> None:
         row = cur.fetchone()
         if row:
             try:
-                current = json.loads(row[0])
+                current = loads_json(row[0])
                 data = _merge_devices_store(current, data)
             except Exception:
                 pass
-    payload = json.dumps(data)
+    payload = dumps_json(data)
     conn.execute(
         "INSERT INTO json_store (name, json, updated_at) VALUES (?, ?, ?) "
         "ON CONFLICT(name) DO UPDATE SET json=excluded.json, updated_at=excluded.updated_at",
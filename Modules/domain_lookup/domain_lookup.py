@@ -13,6 +13,7 @@ import os
 import re
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -22,6 +23,14 @@ if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
 from sqlite_store import read_json_store, write_json_store
 
+_MAX_PARALLEL_LOOKUPS = 8
+# Linux "PING host (ip)" or Windows "Pinging host [ip]" header, first one wins.
+_PING_IDENTITY_RE = re.compile(
+    r"^[ \t]*(?:PING\s+(?P<lname>[^\s(]+)\s+\((?P<lip>[^)]+)\)"
+    r"|Pinging\s+(?P<wname>[^\s\[]+)\s+\[(?P<wip>[^\]]+)\])",
+    re.IGNORECASE | re.MULTILINE,
+)
+
 
 def load_config(path: str) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
@@ -99,15 +108,12 @@ def candidate_names(name: str, strip_catched: bool, suffixes: List[str]) -> List
 
 
 def extract_ping_identity(output: str) -> Tuple[Optional[str], Optional[str]]:
-    for raw_line in output.splitlines():
-        line = raw_line.strip()
-        linux_match = re.match(r"^PING\s+([^\s(]+)\s+\(([^)]+)\)", line, re.IGNORECASE)
-        if linux_match:
-            return linux_match.group(1).strip().strip("."), linux_match.group(2).strip()
-        windows_match = re.match(r"^Pinging\s+([^\s\[]+)\s+\[([^\]]+)\]", line, re.IGNORECASE)
-        if windows_match:
-            return windows_match.group(1).strip().strip("."), windows_match.group(2).strip()
-    return None, None
+    match = _PING_IDENTITY_RE.search(output)
+    if not match:
+        return None, None
+    if match.group("lname"):
+        return match.group("lname").strip().strip("."), match.group("lip").strip()
+    return match.group("wname").strip().strip("."), match.group("wip").strip()
 
 
 def domain_from_fqdn(base_name: str, fqdn: str) -> Optional[str]:
@@ -197,9 +203,8 @@ def main() -> None:
     failed = []
     now = datetime.now().isoformat()
 
-    for device in matched:
+    def lookup_device(device: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
         name = normalize_name(device.get("name") or "")
-        found = False
         last_output = ""
         for base_name, query in candidate_names(name, strip_catched, suffixes):
             fqdn, resolved_ip, output = ping_name(query, ping_count, timeout_seconds)
@@ -214,25 +219,35 @@ def main() -> None:
             device["domain_resolved_ip"] = resolved_ip or ""
             device["domain_last_checked"] = now
             device["last_modified"] = now
-            updated += 1
-            resolved.append({
+            return {
                 "id": device.get("id"),
                 "name": name,
                 "query": query,
                 "fqdn": fqdn,
                 "domain": domain,
                 "resolved_ip": resolved_ip
-            })
-            found = True
-            break
-        if not found:
-            device["domain_last_checked"] = now
-            failed.append({
-                "id": device.get("id"),
-                "name": name,
-                "reason": "not_resolved",
-                "output": last_output[:300]
-            })
+            }, None
+        device["domain_last_checked"] = now
+        return None, {
+            "id": device.get("id"),
+            "name": name,
+            "reason": "not_resolved",
+            "output": last_output[:300]
+        }
+
+    # Each ping blocks in a subprocess for up to the timeout, so look devices
+    # up concurrently. Every worker only touches its own device dict.
+    if matched:
+        with ThreadPoolExecutor(max_workers=min(len(matched), _MAX_PARALLEL_LOOKUPS)) as executor:
+            outcomes = list(executor.map(lookup_device, matched))
+    else:
+        outcomes = []
+    for hit, miss in outcomes:
+        if hit:
+            updated += 1
+            resolved.append(hit)
+        else:
+            failed.append(miss)
 
     data.setdefault("meta", {})["last_modified"] = now
     try:
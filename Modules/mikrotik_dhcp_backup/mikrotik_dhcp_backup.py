@@ -8,6 +8,7 @@ backups/mikrotik_dhcp under the CMapper program directory.
 
 from __future__ import annotations
 
+import functools
 import json
 import os
 import re
@@ -26,6 +27,8 @@ if SHARED_DIR not in sys.path:
 
 from sqlite_store import read_json_store
 
+_IS_WINDOWS = os.name == "nt"
+
 
 def _append_log(path: Optional[str], message: str) -> None:
     if not path:
@@ -50,13 +53,14 @@ def _parse_int(value: Any, default: int, minimum: int, maximum: int) -> int:
     return max(minimum, min(maximum, parsed))
 
 
-def _find_executable(names: list[str]) -> Optional[str]:
+@functools.lru_cache(maxsize=None)
+def _find_executable(names: Tuple[str, ...]) -> Optional[str]:
     for name in names:
         for path_dir in os.environ.get("PATH", "").split(os.pathsep):
             candidate = os.path.join(path_dir, name)
             if os.path.isfile(candidate):
                 return candidate
-        if os.name == "nt":
+        if _IS_WINDOWS:
             system_root = os.environ.get("SystemRoot", r"C:\Windows")
             for candidate in (
                 os.path.join(system_root, "System32", "OpenSSH", name),
@@ -127,8 +131,8 @@ def _run_export(host: str, username: str, password: str, port: int, timeout: int
     if paramiko_result is not None:
         return paramiko_result
 
-    if os.name == "nt":
-        plink_bin = os.environ.get("PLINK_BIN") or _find_executable(["plink.exe", "plink"])
+    if _IS_WINDOWS:
+        plink_bin = os.environ.get("PLINK_BIN") or _find_executable(("plink.exe", "plink"))
         if plink_bin:
             return subprocess.run(
                 [plink_bin, "-ssh", "-batch", "-P", str(port), "-pw", password, f"{username}@{host}", "export"],
@@ -137,7 +141,7 @@ def _run_export(host: str, username: str, password: str, port: int, timeout: int
                 timeout=timeout,
             )
 
-    sshpass_bin = os.environ.get("SSHPASS_BIN") or _find_executable(["sshpass"])
+    sshpass_bin = os.environ.get("SSHPASS_BIN") or _find_executable(("sshpass",))
     if sshpass_bin:
         return subprocess.run(
             [
@@ -157,7 +161,7 @@ def _run_export(host: str, username: str, password: str, port: int, timeout: int
             timeout=timeout,
         )
 
-    ssh_bin = _find_executable(["ssh"])
+    ssh_bin = _find_executable(("ssh",))
     if not ssh_bin:
         raise RuntimeError("No SSH client found. Install paramiko, OpenSSH, sshpass, or PuTTY/plink.")
     return subprocess.run(
@@ -5,22 +5,33 @@ MikroTik MAC Discovery
 Uses RouterOS `/tool/ip/scan` (or `/tool/mac-scan` fallback) via SSH to gather IP/MAC/identity.
 Maps vendor using local OUI ranges file (range-based).
 Outputs device list to be merged into devices.db by the backend module runner.
+
+Usage: mikrotik_mac_discovery.py <config.json>
+       mikrotik_mac_discovery.py --batch-file <configs.json>
+The batch file is a JSON list of config paths; each database is written once.
 """
 
 from __future__ import annotations
 
+import atexit
+import bisect
+import codecs
+import functools
+import heapq
 import ipaddress
 import json
 import os
 import re
-import shlex
+import shutil
 import subprocess
 import sys
+import threading
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Union
 
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 OUI_FILE = os.path.join(MODULE_DIR, "oui_ranges.txt")
@@ -29,13 +40,42 @@ if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
 from sqlite_store import read_json_store, write_json_store
 
+_IS_WINDOWS = os.name == "nt"
+_RECV_CHUNK = 65536
+_MAX_PARALLEL_SCANS = 6
+_SSH_IDLE_SECONDS = 300
+# Pool entries are [client, last_used, users]; a client is only closed once
+# it has left the pool and no worker is still using it.
+_SSH_POOL: Dict[Tuple[str, int, str, Optional[str]], List[Any]] = {}
+_SSH_POOL_LOCK = threading.Lock()
+# RouterOS detail/as-value pairs: key=value or key="value with spaces".
+_KV_RE = re.compile(r'([^\s="]+)=(?:"([^"]*)"|(\S*))')
+_MAC_RE = re.compile(r"(?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}")
+_MAC_SEPARATED_RE = re.compile(r"([0-9A-Fa-f]{2}[:\-]){5}[0-9A-Fa-f]{2}")
+_MAC_BARE_RE = re.compile(r"[0-9A-Fa-f]{12}")
+_IPV4_RE = re.compile(r"\d{1,3}(?:\.\d{1,3}){3}")
+_IPV4_WORD_RE = re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b")
+_IPV4_ONLY_RE = re.compile(r"^\d{1,3}(?:\.\d{1,3}){3}$")
+_CIDR_RE = re.compile(r"^\d{1,3}(?:\.\d{1,3}){3}/\d{1,2}$")
+_ADDR_RANGE_RE = re.compile(r"^\d{1,3}(?:\.\d{1,3}){3}-\d{1,3}(?:\.\d{1,3}){3}$")
+_IP_MAC_RE = re.compile(r"(?P<ip>\d+\.\d+\.\d+\.\d+)\s+(?P<mac>(?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2})")
+_POOL_RANGE_RE = re.compile(r"\d{1,3}(?:\.\d{1,3}){3}(?:-\d{1,3}(?:\.\d{1,3}){3}|/\d+)?")
+_POOL_TOKEN_RE = re.compile(r"^\d+\.\d+\.\d+\.\d+(?:/\d+)?$")
+_INDEXED_ROW_RE = re.compile(r"^\s*\d+")
+_INDEX_PREFIX_RE = re.compile(r"^\d+\s+")
+_ANSI_ESCAPE_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_PROMPT_RE = re.compile(r"(?m)(?:\[[^\]\r\n]+\]\s*)?[>#]\s*$")
+_SCAN_DETAIL_ROW_RE = re.compile(r"(?m)^\s*(?:\d+\s+)?address=")
+_SCAN_TABLE_ROW_RE = re.compile(r"(?m)^\s*\d{1,3}(?:\.\d{1,3}){3}\s+")
+
+
 def is_mac_name(name: str) -> bool:
     if not name:
         return False
     value = name.strip()
-    if re.fullmatch(r"([0-9A-Fa-f]{2}[:\-]){5}[0-9A-Fa-f]{2}", value):
+    if _MAC_SEPARATED_RE.fullmatch(value):
         return True
-    if re.fullmatch(r"[0-9A-Fa-f]{12}", value):
+    if _MAC_BARE_RE.fullmatch(value):
         return True
     return False
 
@@ -102,51 +142,125 @@ def normalize_mac(mac: str) -> str:
     return mac.upper()
 
 
+_MAC_SEPARATORS = str.maketrans("", "", ":.-")
+
+
 def mac_to_int(mac: str) -> int:
-    return int(mac.replace(":", ""), 16)
+    return int.from_bytes(bytes.fromhex(mac.translate(_MAC_SEPARATORS)), "big")
 
 
-def load_oui_ranges(path: str) -> List[Tuple[int, int, str]]:
-    ranges: List[Tuple[int, int, str]] = []
+# Sorted, non-overlapping (starts, ends, vendors) arrays for bisect lookups.
+OuiIndex = Tuple[List[int], List[int], List[str]]
+_OUI_INDEX_CACHE: Dict[Tuple[str, float], OuiIndex] = {}
+_OUI_INDEX_BY_ID: Dict[int, OuiIndex] = {}
+
+
+def _build_oui_index(ranges: List[Tuple[int, int, str]]) -> OuiIndex:
+    """Flatten ranges into disjoint sorted segments.
+
+    Where ranges overlap, the earliest one in the file wins, matching the old
+    first-match linear scan.
+    """
+    order = sorted(range(len(ranges)), key=lambda idx: ranges[idx][0])
+    points = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+    starts: List[int] = []
+    ends: List[int] = []
+    vendors: List[str] = []
+    active: List[Tuple[int, int]] = []
+    pos = 0
+    for seg_start, next_start in zip(points, points[1:]):
+        while pos < len(order) and ranges[order[pos]][0] <= seg_start:
+            heapq.heappush(active, (order[pos], ranges[order[pos]][1]))
+            pos += 1
+        while active and active[0][1] < seg_start:
+            heapq.heappop(active)
+        if not active:
+            continue
+        vendor = ranges[active[0][0]][2]
+        if ends and ends[-1] == seg_start - 1 and vendors[-1] == vendor:
+            ends[-1] = next_start - 1
+            continue
+        starts.append(seg_start)
+        ends.append(next_start - 1)
+        vendors.append(vendor)
+    return starts, ends, vendors
+
+
+def load_oui_ranges(path: str) -> OuiIndex:
     if not os.path.exists(path):
-        return ranges
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or "=" not in line or "-" not in line:
-                continue
-            try:
-                left, vendor = line.split("=", 1)
-                start_str, end_str = left.split("-", 1)
-                vendor_label = vendor.split(",", 1)[0].strip()
-                start = mac_to_int(normalize_mac(start_str))
-                end = mac_to_int(normalize_mac(end_str))
-                ranges.append((start, end, vendor_label))
-            except Exception:
-                continue
-    return ranges
+        return [], [], []
+    cache_key = (path, os.path.getmtime(path))
+    cached = _OUI_INDEX_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    ranges: List[Tuple[int, int, str]] = []
+    with open(path, "rb") as f:
+        data = f.read().decode("utf-8", "ignore")
+    for line in data.split("\n"):
+        left, sep, vendor = line.partition("=")
+        if not sep:
+            continue
+        start_str, sep, end_str = left.partition("-")
+        if not sep:
+            continue
+        start_mac = normalize_mac(start_str)
+        end_mac = normalize_mac(end_str)
+        # Check the shape up front so malformed lines are skipped without
+        # raising from bytes.fromhex for each one.
+        if not _MAC_RE.fullmatch(start_mac) or not _MAC_RE.fullmatch(end_mac):
+            continue
+        vendor_label = vendor.partition(",")[0].strip()
+        ranges.append((mac_to_int(start_mac), mac_to_int(end_mac), vendor_label))
+    index = _build_oui_index(ranges)
+    _OUI_INDEX_CACHE[cache_key] = index
+    _OUI_INDEX_BY_ID[id(index)] = index
+    return index
+
 
+@functools.lru_cache(maxsize=4096)
+def _vendor_for_oui(oui24: int, ranges_id: int) -> Tuple[bool, Optional[str]]:
+    """Resolve a whole 24-bit OUI block at once.
 
-def lookup_vendor(mac: str, ranges: List[Tuple[int, int, str]]) -> Optional[str]:
+    Returns (uniform, vendor). uniform is False when range boundaries fall
+    inside the block, in which case the caller must look up the full MAC.
+    """
+    starts, ends, vendors = _OUI_INDEX_BY_ID[ranges_id]
+    block_start = oui24 << 24
+    block_end = block_start | 0xFFFFFF
+    idx = bisect.bisect_right(starts, block_end) - 1
+    if idx < 0 or ends[idx] < block_start:
+        return True, None
+    if starts[idx] <= block_start and ends[idx] >= block_end:
+        return True, vendors[idx]
+    return False, None
+
+
+def lookup_vendor(mac: str, ranges: OuiIndex) -> Optional[str]:
     try:
         mac_int = mac_to_int(normalize_mac(mac))
     except Exception:
         return None
-    for start, end, vendor in ranges:
-        if start <= mac_int <= end:
+    ranges_id = id(ranges)
+    if _OUI_INDEX_BY_ID.get(ranges_id) is ranges:
+        uniform, vendor = _vendor_for_oui(mac_int >> 24, ranges_id)
+        if uniform:
             return vendor
+    starts, ends, vendors = ranges
+    idx = bisect.bisect_right(starts, mac_int) - 1
+    if idx >= 0 and mac_int <= ends[idx]:
+        return vendors[idx]
     return None
 
 
-def _find_executable(names: List[str]) -> Optional[str]:
+@functools.lru_cache(maxsize=None)
+def _find_executable(names: Tuple[str, ...]) -> Optional[str]:
     for name in names:
         if not name:
             continue
-        for path_dir in os.environ.get("PATH", "").split(os.pathsep):
-            candidate = os.path.join(path_dir, name)
-            if os.path.isfile(candidate):
-                return candidate
-        if os.name == "nt":
+        candidate = shutil.which(name)
+        if candidate:
+            return candidate
+        if _IS_WINDOWS:
             win_candidates = [
                 os.path.join(os.environ.get("SystemRoot", "C:\\Windows"), "System32", "OpenSSH", name),
                 os.path.join(os.environ.get("SystemRoot", "C:\\Windows"), "System32", name),
@@ -158,14 +272,14 @@ def _find_executable(names: List[str]) -> Optional[str]:
 
 
 def _prompt_returned(text: str) -> bool:
-    cleaned = re.sub(r"\x1b\[[0-9;?]*[A-Za-z]", "", text).rstrip()
-    return bool(re.search(r"(?m)(?:\[[^\]\r\n]+\]\s*)?[>#]\s*$", cleaned))
+    cleaned = _ANSI_ESCAPE_RE.sub("", text).rstrip()
+    return bool(_PROMPT_RE.search(cleaned))
 
 
 def _scan_output_has_rows(text: str) -> bool:
     return bool(
-        re.search(r"(?m)^\s*(?:\d+\s+)?address=", text)
-        or re.search(r"(?m)^\s*\d{1,3}(?:\.\d{1,3}){3}\s+", text)
+        _SCAN_DETAIL_ROW_RE.search(text)
+        or _SCAN_TABLE_ROW_RE.search(text)
     )
 
 
@@ -190,30 +304,52 @@ def _routeros_interface_error(text: str) -> bool:
     )
 
 
-def _extract_seen_ips_from_scan(output: str) -> set[str]:
+def _as_lines(output: Union[str, List[str]]) -> List[str]:
+    if isinstance(output, str):
+        return output.splitlines()
+    return output
+
+
+def _extract_seen_ips_from_scan(output: Union[str, List[str]]) -> set[str]:
+    lines = _as_lines(output)
     seen: set[str] = set()
-    for rec in _parse_detail_records(output):
+    for rec in _iter_records(lines):
         ip = rec.get("address") or rec.get("ip-address") or rec.get("address-range")
         if ip:
             seen.add(ip.strip())
-    for raw_line in output.splitlines():
-        if re.search(r"(?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}", raw_line):
-            for ip in re.findall(r"\b\d{1,3}(?:\.\d{1,3}){3}\b", raw_line):
+    for raw_line in lines:
+        if _MAC_RE.search(raw_line):
+            for ip in _IPV4_WORD_RE.findall(raw_line):
                 seen.add(ip)
     return seen
 
 
-def _run_paramiko(router_ip: str, username: str, password: str, cmd: str, timeout: int, port: int, wide_terminal: bool = False) -> Optional[subprocess.CompletedProcess]:
-    try:
-        warnings.filterwarnings("ignore", message=r"TripleDES has been moved.*")
-        import paramiko
-    except Exception:
-        return None
+def _acquire_ssh_client(paramiko: Any, key: Tuple[str, int, str, Optional[str]]) -> Tuple[List[Any], bool]:
+    """Return (entry, reused) for key, connecting when no live client is pooled.
 
+    The caller must hand the entry back with _release_ssh_client.
+    """
+    router_ip, port, username, password = key
+    now = time.time()
+    stale = None
+    with _SSH_POOL_LOCK:
+        entry = _SSH_POOL.get(key)
+        if entry is not None:
+            transport = entry[0].get_transport()
+            if now - entry[1] <= _SSH_IDLE_SECONDS and transport is not None and transport.is_active():
+                entry[1] = now
+                entry[2] += 1
+                return entry, True
+            del _SSH_POOL[key]
+            if not entry[2]:
+                stale = entry[0]
+    _close_ssh_quietly(stale)
+
+    # Connect outside the lock so a slow or unreachable router does not hold up
+    # pool lookups for every other router.
     client = paramiko.SSHClient()
-    channel = None
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         client.connect(
             router_ip,
             port=port,
@@ -223,40 +359,118 @@ def _run_paramiko(router_ip: str, username: str, password: str, cmd: str, timeou
             banner_timeout=10,
             auth_timeout=10
         )
+    except Exception:
+        _close_ssh_quietly(client)
+        raise
+    with _SSH_POOL_LOCK:
+        entry = _SSH_POOL.get(key)
+        if entry is None:
+            entry = [client, now, 1]
+            _SSH_POOL[key] = entry
+            return entry, False
+        # Another worker connected to the same router meanwhile; share its client.
+        entry[1] = now
+        entry[2] += 1
+    _close_ssh_quietly(client)
+    return entry, False
+
+
+def _release_ssh_client(key: Tuple[str, int, str, Optional[str]], entry: List[Any]) -> None:
+    with _SSH_POOL_LOCK:
+        entry[2] -= 1
+        close = not entry[2] and _SSH_POOL.get(key) is not entry
+    if close:
+        _close_ssh_quietly(entry[0])
+
+
+def _evict_ssh_client(key: Tuple[str, int, str, Optional[str]], entry: List[Any]) -> None:
+    """Drop a failed client from the pool; the last worker using it closes it."""
+    with _SSH_POOL_LOCK:
+        if _SSH_POOL.get(key) is entry:
+            del _SSH_POOL[key]
+
+
+def _close_ssh_quietly(client: Any) -> None:
+    if client is None:
+        return
+    try:
+        client.close()
+    except Exception:
+        pass
+
+
+def _close_ssh_pool() -> None:
+    with _SSH_POOL_LOCK:
+        entries = list(_SSH_POOL.values())
+        _SSH_POOL.clear()
+    for client, _, _ in entries:
+        _close_ssh_quietly(client)
+
+
+atexit.register(_close_ssh_pool)
+
+
+def _run_paramiko(router_ip: str, username: str, password: str, cmd: str, timeout: int, port: int, wide_terminal: bool = False) -> Optional[subprocess.CompletedProcess]:
+    try:
+        warnings.filterwarnings("ignore", message=r"TripleDES has been moved.*")
+        import paramiko
+    except Exception:
+        return None
+
+    # Reuse one authenticated transport per router for every command in this
+    # process. A pooled client that went stale is replaced once.
+    key = (router_ip, port, username, password)
+    for attempt in range(2):
+        entry, reused = _acquire_ssh_client(paramiko, key)
+        try:
+            return _paramiko_exec(entry[0], cmd, timeout, wide_terminal)
+        except (paramiko.SSHException, EOFError, OSError):
+            _evict_ssh_client(key, entry)
+            if not reused or attempt:
+                raise
+        finally:
+            _release_ssh_client(key, entry)
+
+
+def _paramiko_exec(client: Any, cmd: str, timeout: int, wide_terminal: bool) -> subprocess.CompletedProcess:
+    channel = None
+    try:
         if wide_terminal:
             channel = client.invoke_shell(term="vt100", width=2000, height=1000)
             channel.settimeout(2)
             deadline = time.time() + max(timeout, 1)
-            initial_chunks: List[bytes] = []
+            initial_text = ""
+            initial_decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
             initial_deadline = min(deadline, time.time() + 5)
             while time.time() < initial_deadline:
                 if channel.recv_ready():
-                    initial_chunks.append(channel.recv(65535))
-                    if _prompt_returned(b"".join(initial_chunks).decode(errors="ignore")):
+                    initial_text += initial_decoder.decode(channel.recv(_RECV_CHUNK))
+                    if _prompt_returned(initial_text):
                         break
                 time.sleep(0.05)
             while channel.recv_ready():
-                channel.recv(65535)
+                channel.recv(_RECV_CHUNK)
             channel.send(cmd + "\r")
             sent_at = time.time()
             last_recv_at = sent_at
             live_scan_cutoff = sent_at + max(5, min(timeout - 1, 30)) if "tool ip-scan" in cmd and "duration=" not in cmd else None
-            out_chunks: List[bytes] = []
+            # Decode incrementally so each poll only touches the newly received
+            # bytes instead of re-joining and re-decoding the whole buffer.
+            out_decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+            out_text = ""
             while True:
                 if channel.recv_ready():
-                    out_chunks.append(channel.recv(65535))
+                    out_text += out_decoder.decode(channel.recv(_RECV_CHUNK))
                     last_recv_at = time.time()
-                    out_text_so_far = b"".join(out_chunks).decode(errors="ignore")
-                    if _prompt_returned(out_text_so_far) and (_scan_output_has_rows(out_text_so_far) or time.time() - sent_at > 1.0):
+                    if _prompt_returned(out_text) and (_scan_output_has_rows(out_text) or time.time() - sent_at > 1.0):
                         break
                     # Some RouterOS ip-scan variants run as a live view and do
                     # not return to the prompt unless interrupted. Once rows are
                     # visible and the output has settled, treat it as complete.
-                    if _scan_output_has_rows(out_text_so_far) and time.time() - last_recv_at > 1.5:
+                    if _scan_output_has_rows(out_text) and time.time() - last_recv_at > 1.5:
                         break
                 else:
-                    out_text_so_far = b"".join(out_chunks).decode(errors="ignore")
-                    if _scan_output_has_rows(out_text_so_far) and time.time() - last_recv_at > 1.5:
+                    if _scan_output_has_rows(out_text) and time.time() - last_recv_at > 1.5:
                         break
                     if live_scan_cutoff is not None and time.time() > live_scan_cutoff:
                         break
@@ -269,35 +483,37 @@ def _run_paramiko(router_ip: str, username: str, password: str, cmd: str, timeou
                 channel.send("\x03")
                 time.sleep(0.1)
                 while channel.recv_ready():
-                    out_chunks.append(channel.recv(65535))
+                    out_text += out_decoder.decode(channel.recv(_RECV_CHUNK))
             except Exception:
                 pass
-            out_text = b"".join(out_chunks).decode(errors="ignore")
+            out_text += out_decoder.decode(b"", final=True)
             return subprocess.CompletedProcess(args=["paramiko", cmd], returncode=0, stdout=out_text, stderr="")
 
         channel = client.get_transport().open_session(timeout=10)
         channel.settimeout(2)
         channel.exec_command(cmd)
         deadline = time.time() + max(timeout, 1)
-        out_chunks: List[bytes] = []
-        err_chunks: List[bytes] = []
-        while True:
+        out_buf = bytearray()
+        err_buf = bytearray()
+        while not channel.exit_status_ready():
+            drained = False
             if channel.recv_ready():
-                out_chunks.append(channel.recv(65535))
+                out_buf += channel.recv(_RECV_CHUNK)
+                drained = True
             if channel.recv_stderr_ready():
-                err_chunks.append(channel.recv_stderr(65535))
-            if channel.exit_status_ready():
-                while channel.recv_ready():
-                    out_chunks.append(channel.recv(65535))
-                while channel.recv_stderr_ready():
-                    err_chunks.append(channel.recv_stderr(65535))
-                break
+                err_buf += channel.recv_stderr(_RECV_CHUNK)
+                drained = True
             if time.time() > deadline:
                 raise subprocess.TimeoutExpired(cmd=["paramiko", cmd], timeout=timeout)
-            time.sleep(0.05)
+            if not drained:
+                time.sleep(0.05)
+        while channel.recv_ready():
+            out_buf += channel.recv(_RECV_CHUNK)
+        while channel.recv_stderr_ready():
+            err_buf += channel.recv_stderr(_RECV_CHUNK)
         exit_status = channel.recv_exit_status()
-        out_text = b"".join(out_chunks).decode(errors="ignore")
-        err_text = b"".join(err_chunks).decode(errors="ignore")
+        out_text = out_buf.decode(errors="ignore")
+        err_text = err_buf.decode(errors="ignore")
         return subprocess.CompletedProcess(args=["paramiko", cmd], returncode=exit_status, stdout=out_text, stderr=err_text)
     finally:
         if channel is not None:
@@ -305,7 +521,83 @@ def _run_paramiko(router_ip: str, username: str, password: str, cmd: str, timeou
                 channel.close()
             except Exception:
                 pass
-        client.close()
+
+
+def _range_bounds(value: str) -> Optional[Tuple[int, int]]:
+    value = (value or "").strip()
+    try:
+        if "-" in value:
+            start_text, end_text = value.split("-", 1)
+            start = int(ipaddress.IPv4Address(start_text.strip()))
+            end = int(ipaddress.IPv4Address(end_text.strip()))
+            return (start, end) if start <= end else (end, start)
+        if "/" in value:
+            net = ipaddress.ip_network(value, strict=False)
+            return int(net.network_address), int(net.broadcast_address)
+        addr = int(ipaddress.IPv4Address(value))
+        return addr, addr
+    except ValueError:
+        return None
+
+
+def collapse_scan_targets(targets: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Merge overlapping scan ranges per interface so each address is scanned once.
+
+    Ranges that are unchanged by merging keep their original text; merged
+    spans are emitted as start-end ranges. Unparseable ranges pass through.
+    """
+    order: List[str] = []
+    spans_by_iface: Dict[str, List[Tuple[int, int, str]]] = {}
+    passthrough: Dict[str, List[str]] = {}
+    for target in targets:
+        iface = target.get("interface") or ""
+        target_range = target.get("range") or ""
+        if iface not in spans_by_iface:
+            order.append(iface)
+            spans_by_iface[iface] = []
+            passthrough[iface] = []
+        bounds = _range_bounds(target_range)
+        if bounds is None:
+            passthrough[iface].append(target_range)
+        else:
+            spans_by_iface[iface].append((bounds[0], bounds[1], target_range))
+
+    collapsed: List[Dict[str, str]] = []
+    for iface in order:
+        merged: List[List[Any]] = []
+        for start, end, text in sorted(spans_by_iface[iface]):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+                    merged[-1][2] = None
+                continue
+            merged.append([start, end, text])
+        for start, end, text in merged:
+            if text is None:
+                text = f"{ipaddress.IPv4Address(start)}-{ipaddress.IPv4Address(end)}"
+            collapsed.append({"interface": iface, "range": text})
+        for text in passthrough[iface]:
+            collapsed.append({"interface": iface, "range": text})
+    return collapsed
+
+
+@functools.lru_cache(maxsize=64)
+def normalize_address_range(value: str) -> str:
+    value = (value or "").strip()
+    if not value:
+        return value
+    if "/" in value:
+        try:
+            net = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            return value
+        # Same bounds as net.hosts() without materialising every host.
+        if net.num_addresses <= 2:
+            start, end = net.network_address, net.broadcast_address
+        else:
+            start, end = net.network_address + 1, net.broadcast_address - 1
+        return f"{start}-{end}"
+    return value
 
 
 def run_ssh_command(router_ip: str, username: str, password: str, cmd: str, timeout: int = 30, port: int = 22, wide_terminal: bool = False) -> subprocess.CompletedProcess:
@@ -317,8 +609,8 @@ def run_ssh_command(router_ip: str, username: str, password: str, cmd: str, time
     if paramiko_result is not None:
         return paramiko_result
 
-    if os.name == "nt":
-        plink_bin = os.environ.get("PLINK_BIN") or _find_executable(["plink.exe", "plink"])
+    if _IS_WINDOWS:
+        plink_bin = os.environ.get("PLINK_BIN") or _find_executable(("plink.exe", "plink"))
         if plink_bin:
             full_cmd = [
                 plink_bin, "-ssh", "-batch", "-P", str(port), "-pw", password,
@@ -326,14 +618,14 @@ def run_ssh_command(router_ip: str, username: str, password: str, cmd: str, time
             ]
             return subprocess.run(full_cmd, capture_output=True, text=True, timeout=timeout)
 
-    sshpass_bin = os.environ.get("SSHPASS_BIN") or _find_executable(["sshpass"])
+    sshpass_bin = os.environ.get("SSHPASS_BIN") or _find_executable(("sshpass",))
     if sshpass_bin:
         ssh_base = ["ssh", "-p", str(port), "-o", "StrictHostKeyChecking=no", f"{username}@{router_ip}", cmd]
         full_cmd = [sshpass_bin, "-p", password, *ssh_base]
         return subprocess.run(full_cmd, capture_output=True, text=True, timeout=timeout)
 
     # Fallback: SSH with keys only (no password prompts)
-    ssh_bin = _find_executable(["ssh"])
+    ssh_bin = _find_executable(("ssh",))
     if not ssh_bin:
         raise RuntimeError("No SSH client found. Install OpenSSH/PuTTY or add paramiko to Python environment.")
     full_cmd = [
@@ -348,35 +640,29 @@ def run_ssh_command(router_ip: str, username: str, password: str, cmd: str, time
     return subprocess.run(full_cmd, capture_output=True, text=True, timeout=timeout)
 
 
-def _parse_detail_records(output: str) -> List[Dict[str, str]]:
-    records: List[Dict[str, str]] = []
+def _iter_records(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Yield RouterOS detail records one at a time as their lines are consumed."""
     current: Dict[str, str] = {}
-    for raw_line in output.splitlines():
+    for raw_line in lines:
         line = raw_line.strip()
         if not line:
             continue
         if line[0].isdigit() and " " in line:
             if current:
-                records.append(current)
+                yield current
                 current = {}
             line = line.split(" ", 1)[1]
-        try:
-            tokens = shlex.split(line)
-        except ValueError:
-            tokens = line.split()
-        for token in tokens:
-            if "=" not in token:
-                continue
-            key, value = token.split("=", 1)
-            current[key.strip()] = value.strip()
+        for match in _KV_RE.finditer(line):
+            quoted, bare = match.group(2), match.group(3)
+            current[match.group(1)] = (quoted if quoted is not None else bare).strip()
     if current:
-        records.append(current)
-    return records
+        yield current
 
 
-def parse_ip_scan(output: str) -> List[Dict[str, str]]:
+def parse_ip_scan(output: Union[str, List[str]]) -> List[Dict[str, str]]:
+    lines = _as_lines(output)
     devices = []
-    for rec in _parse_detail_records(output):
+    for rec in _iter_records(lines):
         ip = rec.get("address") or rec.get("ip-address") or rec.get("address-range")
         mac = rec.get("mac-address")
         scan_hostname = clean_scan_hostname(
@@ -404,10 +690,9 @@ def parse_ip_scan(output: str) -> List[Dict[str, str]]:
         return devices
 
     # RouterOS table output fallback
-    ip_mac_re = re.compile(r"(?P<ip>\d+\.\d+\.\d+\.\d+)\s+(?P<mac>(?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2})")
     header_seen = False
     header_columns: Dict[str, int] = {}
-    for raw_line in output.splitlines():
+    for raw_line in lines:
         line = raw_line.strip()
         if not line:
             continue
@@ -433,10 +718,10 @@ def parse_ip_scan(output: str) -> List[Dict[str, str]]:
         if line.lower().startswith("address") and not header_seen:
             continue
         if header_seen:
-            ip_match = re.search(r"\d{1,3}(?:\.\d{1,3}){3}", raw_line)
+            ip_match = _IPV4_RE.search(raw_line)
             if ip_match:
                 ip = ip_match.group(0)
-                mac_match = re.search(r"(?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}", raw_line)
+                mac_match = _MAC_RE.search(raw_line)
                 mac = mac_match.group(0) if mac_match else ""
                 scan_hostname = ""
                 netbios = ""
@@ -465,7 +750,7 @@ def parse_ip_scan(output: str) -> List[Dict[str, str]]:
                     "interface": None
                 })
                 continue
-        match = ip_mac_re.search(line)
+        match = _IP_MAC_RE.search(line)
         if not match:
             continue
         devices.append({
@@ -478,9 +763,10 @@ def parse_ip_scan(output: str) -> List[Dict[str, str]]:
     return devices
 
 
-def parse_mac_scan(output: str) -> List[Dict[str, str]]:
+def parse_mac_scan(output: Union[str, List[str]]) -> List[Dict[str, str]]:
+    lines = _as_lines(output)
     devices = []
-    for rec in _parse_detail_records(output):
+    for rec in _iter_records(lines):
         mac = rec.get("mac-address")
         identity = rec.get("identity") or rec.get("host-name") or ""
         iface = rec.get("interface")
@@ -495,7 +781,7 @@ def parse_mac_scan(output: str) -> List[Dict[str, str]]:
         return devices
 
     # Table output fallback
-    for raw_line in output.splitlines():
+    for raw_line in lines:
         line = raw_line.strip()
         if not line or line.lower().startswith("columns"):
             continue
@@ -522,14 +808,247 @@ def parse_mac_scan(output: str) -> List[Dict[str, str]]:
     return devices
 
 
-def main() -> None:
-    if len(sys.argv) < 2:
-        print(json.dumps({"status": "error", "message": "Config file required"}))
-        return
+def merge_records(
+    records: List[DeviceRecord],
+    database: Dict[str, Any],
+    site_name: str,
+    note: Optional[str],
+    replace_on_ip: bool,
+    seen_ips: set[str],
+    seen_ip_macs: Dict[str, set[str]],
+    now: str,
+) -> Tuple[int, int, int]:
+    """Merge scan records into ``database`` in place.
+
+    Returns ``(devices_added, devices_updated, availability_updated)``.
+    """
+    devices_added = 0
+    devices_updated = 0
+    if "devices" not in database:
+        database["devices"] = []
+
+    def safe_site(site: str) -> str:
+        return "".join(ch if ch.isalnum() else "_" for ch in site.lower())
+
+    # Only devices in this site can match a record, so index them once by
+    # MAC and IP instead of scanning the whole database for every record.
+    site_by_mac: Dict[str, List[Dict[str, Any]]] = {}
+    site_by_ip: Dict[str, List[Dict[str, Any]]] = {}
+
+    def index_device(device: Dict[str, Any]) -> None:
+        site_by_mac.setdefault((device.get("mac") or "").lower(), []).append(device)
+        if device.get("ip"):
+            site_by_ip.setdefault(device.get("ip"), []).append(device)
+
+    def unindex_device(device: Dict[str, Any], mac_key: str, ip_key: Optional[str]) -> None:
+        for index, key in ((site_by_mac, mac_key), (site_by_ip, ip_key)):
+            bucket = index.get(key) if key is not None else None
+            if bucket:
+                bucket[:] = [d for d in bucket if d is not device]
+
+    def drop_devices(stale_ids: set[str]) -> None:
+        kept_devices = []
+        for d in database["devices"]:
+            if d.get("id") in stale_ids:
+                if d.get("site") == site_name:
+                    unindex_device(d, (d.get("mac") or "").lower(), d.get("ip"))
+                continue
+            kept_devices.append(d)
+        database["devices"] = kept_devices
+
+    for device in database["devices"]:
+        if device.get("site") == site_name:
+            index_device(device)
+
+    def locked_collision(rec: DeviceRecord) -> Optional[Dict[str, Any]]:
+        rec_mac = (rec.mac or "").lower()
+        candidates = (site_by_mac.get(rec_mac, []) if rec_mac else []) + (site_by_ip.get(rec.ip, []) if rec.ip else [])
+        return next((d for d in candidates if d.get("locked")), None)
+
+    def preferred_name_for_record(rec: DeviceRecord, dtype: str, existing_name: str = "") -> str:
+        if rec.dhcp_name and not rec.catch_ip_thief:
+            return rec.dhcp_name
+        if rec.catch_ip_thief and dtype in ("pc", "pda", "unknown", ""):
+            if not is_truncated_name(rec.scan_name):
+                return f"Catched-{rec.scan_name}"
+            return existing_name or rec.mac
+        if dtype in ("pc", "pda"):
+            if rec.name and not is_truncated_name(rec.name):
+                return rec.name
+            return existing_name
+        if dtype not in ("pc", "pda", "unknown", "") and existing_name.startswith("Catched-"):
+            return existing_name[len("Catched-"):]
+        return existing_name or rec.name
+
+    touched_device_ids: set[str] = set()
+    site_slug = safe_site(site_name)
+    for rec in records:
+        mac_id = f"dev_mac_{rec.mac.replace(':', '').lower()}"
+        device_id = f"{mac_id}_{site_slug}"
+        if locked_collision(rec):
+            continue
+        rec_mac_key = rec.mac.lower()
+        existing_by_mac = next(iter(site_by_mac.get(rec_mac_key, [])), None)
+        ip_matches = []
+        if replace_on_ip and rec.ip:
+            ip_matches = [d for d in site_by_ip.get(rec.ip, []) if not d.get("locked")]
+
+        if replace_on_ip and rec.ip and existing_by_mac:
+            stale_ip_ids = {
+                d.get("id") for d in ip_matches
+                if d.get("id") and (d.get("mac") or "").lower() != rec.mac.lower()
+            }
+            if stale_ip_ids:
+                drop_devices(stale_ip_ids)
+
+        existing = existing_by_mac
+        matched_by_mac = existing is not None
+        if not existing and ip_matches:
+            existing = next(
+                (
+                    d for d in ip_matches
+                    if (d.get("mac") or "").lower() == rec.mac.lower()
+                    or not (d.get("mac") or "").strip()
+                ),
+                None
+            )
+            if existing is None:
+                existing = ip_matches[0]
+            matched_by_mac = False
+
+        if replace_on_ip and existing and rec.ip:
+            stale_ip_ids = {
+                d.get("id") for d in ip_matches
+                if d.get("id")
+                and d.get("id") != existing.get("id")
+                and (d.get("mac") or "").lower() != rec.mac.lower()
+            }
+            if stale_ip_ids:
+                drop_devices(stale_ip_ids)
+
+        if not existing and not replace_on_ip and rec.ip:
+            existing_same_ip_mac = next(
+                (
+                    d for d in site_by_ip.get(rec.ip, [])
+                    if (d.get("mac") or "").lower() == rec_mac_key
+                ),
+                None
+            )
+            if existing_same_ip_mac:
+                existing = existing_same_ip_mac
+                matched_by_mac = True
+
+        if existing:
+            if existing.get("locked"):
+                continue
+            touched_device_ids.add(existing.get("id") or "")
+            existing_name = existing.get("name") or ""
+            dtype = (existing.get("type") or "").strip().lower()
+            changed = False
+            if matched_by_mac or replace_on_ip:
+                new_name = preferred_name_for_record(rec, dtype, existing_name)
+                if new_name and existing.get("name") != new_name:
+                    existing["name"] = new_name
+                    changed = True
+                updates = {
+                    "ip": rec.ip or existing.get("ip"),
+                    "vendor": rec.vendor or existing.get("vendor"),
+                    "mac": rec.mac,
+                    "oui": rec.oui or existing.get("oui"),
+                    "discovered_by": "mikrotik_mac_discovery"
+                }
+            else:
+                updates = {}
+                if not existing.get("ip") and rec.ip:
+                    updates["ip"] = rec.ip
+                if not existing.get("vendor") and rec.vendor:
+                    updates["vendor"] = rec.vendor
+                if not existing.get("mac") and rec.mac:
+                    updates["mac"] = rec.mac
+                if not existing.get("oui") and rec.oui:
+                    updates["oui"] = rec.oui
+                if not existing.get("discovered_by"):
+                    updates["discovered_by"] = "mikrotik_mac_discovery"
+                if not existing_name:
+                    new_name = preferred_name_for_record(rec, dtype, existing_name)
+                    if new_name:
+                        updates["name"] = new_name
+            previous_mac_key = (existing.get("mac") or "").lower()
+            previous_ip = existing.get("ip")
+            for key, value in updates.items():
+                if value is not None and existing.get(key) != value:
+                    existing[key] = value
+                    changed = True
+            if (existing.get("mac") or "").lower() != previous_mac_key or existing.get("ip") != previous_ip:
+                unindex_device(existing, previous_mac_key, previous_ip)
+                index_device(existing)
+            if note and replace_on_ip:
+                existing["notes"] = f"{existing.get('notes', '')} {note}".strip()
+                changed = True
+            existing["last_seen"] = now
+            if changed:
+                existing["last_modified"] = now
+            devices_updated += 1
+        else:
+            name_value = rec.name
+            if rec.dhcp_name and not rec.catch_ip_thief:
+                name_value = rec.dhcp_name
+            elif rec.catch_ip_thief:
+                name_value = f"Catched-{rec.scan_name}" if not is_truncated_name(rec.scan_name) else rec.mac
+            new_device = {
+                "id": device_id,
+                "site": site_name,
+                "name": name_value,
+                "ip": rec.ip,
+                "mac": rec.mac,
+                "vendor": rec.vendor,
+                "oui": rec.oui,
+                "type": "unknown",
+                "model": "",
+                "platform": "",
+                "capabilities": "",
+                "discovered_by": "mikrotik_mac_discovery",
+                "discovered_at": now,
+                "last_seen": now,
+                "last_modified": now,
+                "notes": note or ""
+            }
+            database["devices"].append(new_device)
+            index_device(new_device)
+            touched_device_ids.add(device_id)
+            devices_added += 1
+
+    availability_updated = 0
+    if seen_ips:
+        for device in database.get("devices", []):
+            if device.get("site") != site_name:
+                continue
+            if device.get("locked"):
+                continue
+            device_id_existing = device.get("id") or ""
+            if device_id_existing in touched_device_ids:
+                continue
+            if (device.get("ip") or "").strip() not in seen_ips:
+                continue
+            device_mac = normalize_mac(device.get("mac") or "").lower() if device.get("mac") else ""
+            scan_macs = seen_ip_macs.get((device.get("ip") or "").strip(), set())
+            if device_mac and scan_macs and device_mac not in scan_macs:
+                continue
+            device["last_seen"] = now
+            touched_device_ids.add(device_id_existing)
+            availability_updated += 1
+        devices_updated += availability_updated
+
+    database.setdefault("meta", {})["last_modified"] = now
+    return devices_added, devices_updated, availability_updated
 
-    config_path = sys.argv[1]
-    config = load_config(config_path)
 
+def run_discovery(config: Dict[str, Any], database: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Scan one router and merge the results into its devices database.
+
+    When ``database`` is given the caller owns it: the scan is merged into
+    that dict in memory and nothing is read from or written to disk.
+    """
     params = config.get("parameters", config)
     router_ip = params.get("router_ip")
     router_device_id = params.get("router_device_id")
@@ -554,26 +1073,28 @@ def main() -> None:
 
     def _valid_scan_range(range_value: str) -> bool:
         range_value = (range_value or "").strip()
-        valid_range = re.match(r"^\d{1,3}(?:\.\d{1,3}){3}-\d{1,3}(?:\.\d{1,3}){3}$", range_value)
-        valid_single = re.match(r"^\d{1,3}(?:\.\d{1,3}){3}$", range_value)
-        valid_cidr = re.match(r"^\d{1,3}(?:\.\d{1,3}){3}/\d{1,2}$", range_value)
+        valid_range = _ADDR_RANGE_RE.match(range_value)
+        valid_single = _IPV4_ONLY_RE.match(range_value)
+        valid_cidr = _CIDR_RE.match(range_value)
         return bool(valid_range or valid_single or valid_cidr)
 
     if address_range:
         range_value = address_range.strip()
         if not _valid_scan_range(range_value):
-            print(json.dumps({
+            return {
                 "status": "error",
                 "message": "Invalid address range format. Use a single IP, CIDR, or start-end range like 10.192.111.1-10.192.111.126."
-            }))
-            return
+            }
     extra_address_ranges = [r for r in extra_address_ranges if _valid_scan_range(r)]
 
     if address_range and not interface:
         interface = "ether1"
-    if db_path:
-        data = read_json_store(db_path, "devices") or {}
-        if not router_ip and router_device_id:
+    if db_path and not router_ip:
+        # Only the router lookup needs the database up front. A standalone run
+        # re-reads it for the merge because the scan can take minutes and other
+        # modules may have written in the meantime.
+        data = database if database is not None else (read_json_store(db_path, "devices") or {})
+        if router_device_id:
             for dev in data.get("devices", []):
                 if dev.get("id") == router_device_id:
                     router_ip = dev.get("ip")
@@ -593,31 +1114,12 @@ def main() -> None:
                     if router_ip:
                         break
     if not router_ip or not username or password is None:
-        print(json.dumps({"status": "error", "message": "Missing router_ip/username/password"}))
-        return
+        return {"status": "error", "message": "Missing router_ip/username/password"}
     if not db_path:
-        print(json.dumps({"status": "error", "message": "Missing database_path"}))
-        return
+        return {"status": "error", "message": "Missing database_path"}
 
     oui_ranges = load_oui_ranges(OUI_FILE)
 
-    def normalize_address_range(value: str) -> str:
-        value = (value or "").strip()
-        if not value:
-            return value
-        if "/" in value:
-            try:
-                net = ipaddress.ip_network(value, strict=False)
-                hosts = list(net.hosts())
-                if not hosts:
-                    return value
-                start = hosts[0]
-                end = hosts[-1]
-                return f"{start}-{end}"
-            except Exception:
-                return value
-        return value
-
     def build_scan_command(
         path: str,
         target_range: str,
@@ -660,7 +1162,7 @@ def main() -> None:
             network = None
             if len(parts) >= 3:
                 net_or_mask = parts[1]
-                if re.match(r"^\d{1,3}(?:\.\d{1,3}){3}$", net_or_mask):
+                if _IPV4_ONLY_RE.match(net_or_mask):
                     try:
                         network = ipaddress.ip_network(f"{addr.split('/')[0]}/{net_or_mask}", strict=False)
                     except ValueError:
@@ -703,7 +1205,7 @@ def main() -> None:
             network = None
             if len(parts) >= 3:
                 net_or_mask = parts[1]
-                if re.match(r"^\d{1,3}(?:\.\d{1,3}){3}$", net_or_mask):
+                if _IPV4_ONLY_RE.match(net_or_mask):
                     try:
                         network = ipaddress.ip_network(f"{addr.split('/')[0]}/{net_or_mask}", strict=False)
                     except ValueError:
@@ -727,8 +1229,7 @@ def main() -> None:
         except Exception:
             return []
         output = (result.stdout or "") + "\n" + (result.stderr or "")
-        range_re = re.compile(r"\d{1,3}(?:\.\d{1,3}){3}(?:-\d{1,3}(?:\.\d{1,3}){3}|/\d+)?")
-        table_ranges = range_re.findall(output)
+        table_ranges = _POOL_RANGE_RE.findall(output)
         if table_ranges:
             cleaned: List[str] = []
             seen_ranges: set[str] = set()
@@ -764,7 +1265,7 @@ def main() -> None:
             token = item.strip().strip(",")
             if not token:
                 continue
-            if re.match(r"^\d+\.\d+\.\d+\.\d+(?:/\d+)?$", token) or "-" in token:
+            if _POOL_TOKEN_RE.match(token) or "-" in token:
                 cleaned.append(token)
         return cleaned
 
@@ -774,33 +1275,33 @@ def main() -> None:
         except Exception:
             return {}
         output = (result.stdout or "") + "\n" + (result.stderr or "")
+        output_lines = output.splitlines()
         pools: Dict[str, List[str]] = {}
-        range_re = re.compile(r"\d{1,3}(?:\.\d{1,3}){3}(?:-\d{1,3}(?:\.\d{1,3}){3}|/\d+)?")
-        for rec in _parse_detail_records(output):
+        for rec in _iter_records(output_lines):
             name = rec.get("name")
             ranges = rec.get("ranges") or rec.get("range") or ""
             if not name or not ranges:
                 continue
-            items = range_re.findall(ranges)
+            items = _POOL_RANGE_RE.findall(ranges)
             if items:
                 pools[name] = items
         header = None
-        for line in output.splitlines():
+        for line in output_lines:
             if "NAME" in line and "RANGES" in line:
                 header = line
                 break
         if header:
             name_idx = header.find("NAME")
             ranges_idx = header.find("RANGES")
-            for raw_line in output.splitlines():
+            for raw_line in output_lines:
                 if not raw_line.strip() or raw_line.strip().startswith((";", "Flags:", "#")):
                     continue
-                if not re.match(r"^\s*\d+", raw_line):
+                if not _INDEXED_ROW_RE.match(raw_line):
                     continue
                 name = raw_line[name_idx:ranges_idx].strip() if ranges_idx != -1 else ""
-                name = re.sub(r"^\d+\s+", "", name).strip()
+                name = _INDEX_PREFIX_RE.sub("", name).strip()
                 ranges_text = raw_line[ranges_idx:].strip() if ranges_idx != -1 else raw_line
-                items = range_re.findall(ranges_text)
+                items = _POOL_RANGE_RE.findall(ranges_text)
                 if name and items:
                     pools[name] = items
         return pools
@@ -811,9 +1312,10 @@ def main() -> None:
         except Exception:
             return []
         output = (result.stdout or "") + "\n" + (result.stderr or "")
+        output_lines = output.splitlines()
         servers: List[Dict[str, str]] = []
         header = None
-        for line in output.splitlines():
+        for line in output_lines:
             if "NAME" in line and "INTERFACE" in line and "ADDRESS-POOL" in line:
                 header = line
                 break
@@ -823,15 +1325,15 @@ def main() -> None:
             relay_idx = header.find("RELAY")
             pool_idx = header.find("ADDRESS-POOL")
             lease_idx = header.find("LEASE-TIME")
-            for raw_line in output.splitlines():
+            for raw_line in output_lines:
                 if not raw_line.strip() or raw_line.strip().startswith(";;;"):
                     continue
                 if raw_line.lstrip().startswith(("Flags:", "#")):
                     continue
-                if not re.match(r"^\s*\d+", raw_line):
+                if not _INDEXED_ROW_RE.match(raw_line):
                     continue
                 name = raw_line[name_idx:iface_idx].strip() if iface_idx != -1 else raw_line[name_idx:].strip().split()[0]
-                name = re.sub(r"^\d+\s+", "", name).strip()
+                name = _INDEX_PREFIX_RE.sub("", name).strip()
                 iface_end = relay_idx if relay_idx != -1 else pool_idx
                 iface = raw_line[iface_idx:iface_end].strip() if iface_idx != -1 and iface_end != -1 else ""
                 pool_end = lease_idx if lease_idx != -1 else len(raw_line)
@@ -841,7 +1343,7 @@ def main() -> None:
             return servers
 
         # Fallback: token parse
-        for raw_line in output.splitlines():
+        for raw_line in output_lines:
             line = raw_line.strip()
             if not line or line.lower().startswith("flags:") or line.startswith(";;;"):
                 continue
@@ -868,12 +1370,13 @@ def main() -> None:
             result = None
         if result and result.returncode == 0:
             output = (result.stdout or "") + "\n" + (result.stderr or "")
+            output_lines = output.splitlines()
             if trace_output:
                 print("=== dhcp lease command ===", file=sys.stderr)
                 print(detail_cmd, file=sys.stderr)
                 print("=== dhcp lease output (detail) ===", file=sys.stderr)
                 print(output, file=sys.stderr)
-            for rec in _parse_detail_records(output):
+            for rec in _iter_records(output_lines):
                 ip = rec.get("address") or rec.get("ip-address")
                 name = rec.get("host-name") or rec.get("host-name")
                 mac = rec.get("mac-address")
@@ -926,11 +1429,12 @@ def main() -> None:
                 "lease_pairs": lease_pairs
             }
         output = (result.stdout or "") + "\n" + (result.stderr or "")
+        output_lines = output.splitlines()
         if trace_output:
             print("=== dhcp lease output (table) ===", file=sys.stderr)
             print(output, file=sys.stderr)
         header = None
-        for line in output.splitlines():
+        for line in output_lines:
             if "ADDRESS" in line and "HOST-NAME" in line:
                 header = line
                 break
@@ -941,7 +1445,7 @@ def main() -> None:
             server_idx = header.find("SERVER")
             status_idx = header.find("STATUS")
             last_seen_idx = header.find("LAST-SEEN")
-            for raw_line in output.splitlines():
+            for raw_line in output_lines:
                 if not raw_line.strip() or raw_line.strip().startswith(";;;"):
                     continue
                 if raw_line.lstrip().startswith(("Flags:", "#")):
@@ -984,8 +1488,7 @@ def main() -> None:
                 "lease_pairs": lease_pairs
             }
 
-        ip_re = re.compile(r"^\d{1,3}(?:\.\d{1,3}){3}$")
-        for raw_line in output.splitlines():
+        for raw_line in output_lines:
             line = raw_line.strip()
             if not line or line.startswith(";;;") or line.lower().startswith("flags:"):
                 continue
@@ -994,7 +1497,7 @@ def main() -> None:
                 continue
             ip_idx = None
             for idx, token in enumerate(parts):
-                if ip_re.match(token):
+                if _IPV4_ONLY_RE.match(token):
                     ip_idx = idx
                     break
             if ip_idx is None:
@@ -1119,123 +1622,140 @@ def main() -> None:
             f"pairs={len(dhcp_hostnames.get('lease_pairs', set()))} ===",
             file=sys.stderr
         )
-    scan_targets = resolve_scan_targets()
+    scan_targets = collapse_scan_targets(resolve_scan_targets())
     if not scan_targets:
-        print(json.dumps({"status": "error", "message": "No address ranges found for scan."}))
-        return
+        return {"status": "error", "message": "No address ranges found for scan."}
     scan_errors: List[str] = []
 
-    for path in scan_paths:
-        for target in scan_targets:
-            target_range = target.get("range") or ""
-            target_iface = target.get("interface") or None
-            if not target_iface:
+    def run_target_scan(path: str, target_range: str, target_iface: str) -> Dict[str, Any]:
+        attempts = [
+            {"include_interface": True, "include_duration": True},
+            {"include_interface": True, "include_duration": False},
+        ]
+        result = None
+        output = ""
+        combined_cmd = ""
+        traces: List[Tuple[str, str]] = []
+        for attempt in attempts:
+            combined_cmd = build_scan_command(
+                path,
+                target_range,
+                target_iface,
+                include_interface=attempt["include_interface"],
+                include_duration=attempt["include_duration"]
+            )
+            try:
+                result = run_ssh_command(router_ip, username, password, combined_cmd, timeout=duration + 15, port=ssh_port, wide_terminal=True)
+                output = (result.stdout or "") + "\n" + (result.stderr or "")
+                if result.returncode == 0 and not _routeros_command_error(output) and not _scan_output_has_rows(output):
+                    result = run_ssh_command(router_ip, username, password, combined_cmd, timeout=duration + 15, port=ssh_port)
+            except subprocess.TimeoutExpired as exc:
+                output = f"SSH command timed out after {exc.timeout}s while running: {combined_cmd}"
+                result = subprocess.CompletedProcess(args=["paramiko", combined_cmd], returncode=124, stdout="", stderr=output)
+            except RuntimeError as exc:
+                return {"fatal": str(exc), "traces": traces}
+
+            output = (result.stdout or "") + "\n" + (result.stderr or "")
+            traces.append((combined_cmd, output))
+            if result.returncode == 0 and not _routeros_command_error(output):
+                break
+            if ("Permission denied" in output or "Authentication failed" in output):
+                return {
+                    "fatal": "SSH authentication failed. Use correct credentials or install PuTTY/plink on Windows.",
+                    "traces": traces
+                }
+            if _routeros_interface_error(output) and attempt["include_interface"]:
+                attempts.append({"include_interface": False, "include_duration": attempt["include_duration"]})
                 continue
-            attempts = [
-                {"include_interface": True, "include_duration": True},
-                {"include_interface": True, "include_duration": False},
-            ]
-            result = None
-            output = ""
-            combined_cmd = ""
-            for attempt in attempts:
-                combined_cmd = build_scan_command(
-                    path,
-                    target_range,
-                    target_iface,
-                    include_interface=attempt["include_interface"],
-                    include_duration=attempt["include_duration"]
-                )
-                try:
-                    result = run_ssh_command(router_ip, username, password, combined_cmd, timeout=duration + 15, port=ssh_port, wide_terminal=True)
-                    output = (result.stdout or "") + "\n" + (result.stderr or "")
-                    if result.returncode == 0 and not _routeros_command_error(output) and not _scan_output_has_rows(output):
-                        result = run_ssh_command(router_ip, username, password, combined_cmd, timeout=duration + 15, port=ssh_port)
-                except subprocess.TimeoutExpired as exc:
-                    output = f"SSH command timed out after {exc.timeout}s while running: {combined_cmd}"
-                    result = subprocess.CompletedProcess(args=["paramiko", combined_cmd], returncode=124, stdout="", stderr=output)
-                except RuntimeError as exc:
-                    print(json.dumps({"status": "error", "message": str(exc)}))
-                    return
+            if _routeros_command_error(output):
+                continue
+        return {"result": result, "output": output, "traces": traces}
+
+    # Scans on different ranges are independent and each one blocks for the
+    # scan duration, so run the SSH side concurrently and parse in order.
+    scan_jobs = [
+        (path, target.get("range") or "", target.get("interface"))
+        for path in scan_paths
+        for target in scan_targets
+        if target.get("interface")
+    ]
+    if scan_jobs:
+        with ThreadPoolExecutor(max_workers=min(len(scan_jobs), _MAX_PARALLEL_SCANS)) as executor:
+            scan_results = list(executor.map(lambda job: run_target_scan(*job), scan_jobs))
+    else:
+        scan_results = []
 
-                output = (result.stdout or "") + "\n" + (result.stderr or "")
-                if trace_output:
-                    print(f"=== ip-scan command ===\n{combined_cmd}", file=sys.stderr)
-                    print(f"=== ip-scan output ({path}) ===\n{output}", file=sys.stderr)
-                if result.returncode == 0 and not _routeros_command_error(output):
-                    break
-                if ("Permission denied" in output or "Authentication failed" in output):
-                    print(json.dumps({
-                        "status": "error",
-                        "message": "SSH authentication failed. Use correct credentials or install PuTTY/plink on Windows."
-                    }))
-                    return
-                if _routeros_interface_error(output) and attempt["include_interface"]:
-                    attempts.append({"include_interface": False, "include_duration": attempt["include_duration"]})
-                    continue
-                if _routeros_command_error(output):
+    for (path, target_range, target_iface), scan in zip(scan_jobs, scan_results):
+        if trace_output:
+            for combined_cmd, traced_output in scan["traces"]:
+                print(f"=== ip-scan command ===\n{combined_cmd}", file=sys.stderr)
+                print(f"=== ip-scan output ({path}) ===\n{traced_output}", file=sys.stderr)
+        if scan.get("fatal"):
+            return {"status": "error", "message": scan["fatal"]}
+        result = scan["result"]
+        output = scan["output"]
+        if result is None or result.returncode != 0 or _routeros_command_error(output):
+            err_text = output.strip()
+            if err_text:
+                scan_errors.append(err_text[:1000])
+            continue
+        dhcp_hits = 0
+        output_lines = output.splitlines()
+        seen_ips.update(_extract_seen_ips_from_scan(output_lines))
+        for item in parse_ip_scan(output_lines):
+            if not item.get("interface") and target_iface:
+                item["interface"] = target_iface
+            ip = item.get("ip")
+            mac = item.get("mac")
+            if ip:
+                seen_ips.add(ip)
+            if ip and not mac:
+                lease_mac = dhcp_hostnames.get("mac_by_ip", {}).get(ip)
+                if lease_mac:
+                    item["mac"] = lease_mac
+                    item["identity"] = item.get("identity") or lease_mac
+                    mac = lease_mac
+            if ip and mac:
+                seen_ip_macs.setdefault(ip, set()).add(normalize_mac(mac).lower())
+            ip_key = (item.get("ip") or "").strip()
+            mac_key = normalize_mac(item.get("mac") or "") if item.get("mac") else ""
+            iface_key = (item.get("interface") or target_iface or "").strip()
+            dedupe_key = ("mac", mac_key, iface_key) if mac_key else ("ip", ip_key, iface_key)
+            if ip_key or mac_key:
+                if dedupe_key in seen_devices:
                     continue
-            if result is None or result.returncode != 0 or _routeros_command_error(output):
-                err_text = output.strip()
-                if err_text:
-                    scan_errors.append(err_text[:1000])
-                continue
-            dhcp_hits = 0
-            seen_ips.update(_extract_seen_ips_from_scan(output))
-            for item in parse_ip_scan(output):
-                if not item.get("interface") and target_iface:
-                    item["interface"] = target_iface
-                ip = item.get("ip")
-                mac = item.get("mac")
-                if ip:
-                    seen_ips.add(ip)
-                if ip and not mac:
-                    lease_mac = dhcp_hostnames.get("mac_by_ip", {}).get(ip)
-                    if lease_mac:
-                        item["mac"] = lease_mac
-                        item["identity"] = item.get("identity") or lease_mac
-                        mac = lease_mac
-                if ip and mac:
-                    seen_ip_macs.setdefault(ip, set()).add(normalize_mac(mac).lower())
-                ip_key = (item.get("ip") or "").strip()
-                mac_key = normalize_mac(item.get("mac") or "") if item.get("mac") else ""
-                iface_key = (item.get("interface") or target_iface or "").strip()
-                dedupe_key = ("mac", mac_key, iface_key) if mac_key else ("ip", ip_key, iface_key)
-                if ip_key or mac_key:
-                    if dedupe_key in seen_devices:
-                        continue
-                    seen_devices.add(dedupe_key)
-                ip_match = dhcp_hostnames.get("by_ip", {}).get(ip) if ip else None
-                mac_key = normalize_mac(mac) if mac else None
-                mac_match = dhcp_hostnames.get("by_mac", {}).get(mac_key) if mac_key else None
-                scan_hostname = (item.get("scan_hostname") or "").strip()
-                netbios_label = (item.get("netbios") or "").strip()
-                scan_has_real_name = bool(scan_hostname) and not is_mac_name(scan_hostname)
-                scan_is_truncated = is_truncated_name(scan_hostname)
-                is_catch_ip_thief = False
-                if catch_ip_thieves and ip and not ip_match:
-                    active_ips = dhcp_hostnames.get("active_ips", set())
-                    lease_pairs = dhcp_hostnames.get("lease_pairs", set())
-                    lease_match = False
-                    if mac:
-                        try:
-                            lease_match = (ip, normalize_mac(mac)) in lease_pairs
-                        except Exception:
-                            lease_match = False
-                    is_catch_ip_thief = ip not in active_ips and not lease_match
-                if ip_match and (not scan_has_real_name or scan_is_truncated):
-                    item["dhcp_hostname"] = ip_match
-                    dhcp_hits += 1
-                elif mac_match and not scan_has_real_name and not is_catch_ip_thief:
-                    item["dhcp_hostname"] = mac_match
-                    dhcp_hits += 1
-                if not scan_has_real_name and netbios_label:
-                    item["identity"] = item.get("dhcp_hostname") or netbios_label
-                if is_catch_ip_thief:
-                    item["catch_ip_thief"] = True
-                devices.append(item)
-            if trace_output and use_dhcp_hostname:
-                print(f"=== dhcp hostname matches: {dhcp_hits} ===", file=sys.stderr)
+                seen_devices.add(dedupe_key)
+            ip_match = dhcp_hostnames.get("by_ip", {}).get(ip) if ip else None
+            mac_key = normalize_mac(mac) if mac else None
+            mac_match = dhcp_hostnames.get("by_mac", {}).get(mac_key) if mac_key else None
+            scan_hostname = (item.get("scan_hostname") or "").strip()
+            netbios_label = (item.get("netbios") or "").strip()
+            scan_has_real_name = bool(scan_hostname) and not is_mac_name(scan_hostname)
+            scan_is_truncated = is_truncated_name(scan_hostname)
+            is_catch_ip_thief = False
+            if catch_ip_thieves and ip and not ip_match:
+                active_ips = dhcp_hostnames.get("active_ips", set())
+                lease_pairs = dhcp_hostnames.get("lease_pairs", set())
+                lease_match = False
+                if mac:
+                    try:
+                        lease_match = (ip, normalize_mac(mac)) in lease_pairs
+                    except Exception:
+                        lease_match = False
+                is_catch_ip_thief = ip not in active_ips and not lease_match
+            if ip_match and (not scan_has_real_name or scan_is_truncated):
+                item["dhcp_hostname"] = ip_match
+                dhcp_hits += 1
+            elif mac_match and not scan_has_real_name and not is_catch_ip_thief:
+                item["dhcp_hostname"] = mac_match
+                dhcp_hits += 1
+            if not scan_has_real_name and netbios_label:
+                item["identity"] = item.get("dhcp_hostname") or netbios_label
+            if is_catch_ip_thief:
+                item["catch_ip_thief"] = True
+            devices.append(item)
+        if trace_output and use_dhcp_hostname:
+            print(f"=== dhcp hostname matches: {dhcp_hits} ===", file=sys.stderr)
 
     # Only ip-scan is used; mac-scan disabled by request.
 
@@ -1267,219 +1787,34 @@ def main() -> None:
         )
         records.append(rec)
 
-    # Merge into devices.db
-    devices_added = 0
-    devices_updated = 0
-    database = read_json_store(db_path, "devices")
-    if database is None:
-        print(json.dumps({"status": "error", "message": "Failed to read database"}))
-        return
-
+    # Merge into devices.db. A scan that saw no hosts at all cannot add or
+    # refresh anything, so it skips the database entirely.
     now = datetime.now().isoformat()
-    if "devices" not in database:
-        database["devices"] = []
-
-    def safe_site(site: str) -> str:
-        return "".join(ch if ch.isalnum() else "_" for ch in site.lower())
-
-    def locked_collision(rec: DeviceRecord) -> Optional[Dict[str, Any]]:
-        rec_mac = (rec.mac or "").lower()
-        for device in database["devices"]:
-            if device.get("site") != site_name or not device.get("locked"):
-                continue
-            if rec_mac and (device.get("mac") or "").lower() == rec_mac:
-                return device
-            if rec.ip and device.get("ip") == rec.ip:
-                return device
-        return None
-
-    def preferred_name_for_record(rec: DeviceRecord, dtype: str, existing_name: str = "") -> str:
-        if rec.dhcp_name and not rec.catch_ip_thief:
-            return rec.dhcp_name
-        if rec.catch_ip_thief and dtype in ("pc", "pda", "unknown", ""):
-            if not is_truncated_name(rec.scan_name):
-                return f"Catched-{rec.scan_name}"
-            return existing_name or rec.mac
-        if dtype in ("pc", "pda"):
-            if rec.name and not is_truncated_name(rec.name):
-                return rec.name
-            return existing_name
-        if dtype not in ("pc", "pda", "unknown", "") and existing_name.startswith("Catched-"):
-            return existing_name[len("Catched-"):]
-        return existing_name or rec.name
-
-    touched_device_ids: set[str] = set()
-    for rec in records:
-        mac_id = f"dev_mac_{rec.mac.replace(':', '').lower()}"
-        device_id = f"{mac_id}_{safe_site(site_name)}"
-        if locked_collision(rec):
-            continue
-        existing_by_mac = next(
-            (d for d in database["devices"] if d.get("mac", "").lower() == rec.mac.lower() and d.get("site") == site_name),
-            None
+    devices_added = devices_updated = availability_updated = 0
+    if records or seen_ips:
+        standalone = database is None
+        if standalone:
+            database = read_json_store(db_path, "devices")
+            if database is None:
+                return {"status": "error", "message": "Failed to read database"}
+
+        devices_added, devices_updated, availability_updated = merge_records(
+            records,
+            database,
+            site_name=site_name,
+            note=note,
+            replace_on_ip=replace_on_ip,
+            seen_ips=seen_ips,
+            seen_ip_macs=seen_ip_macs,
+            now=now,
         )
-        ip_matches = []
-        if replace_on_ip and rec.ip:
-            ip_matches = [
-                d for d in database["devices"]
-                if d.get("site") == site_name
-                and d.get("ip") == rec.ip
-                and not d.get("locked")
-            ]
-
-        if replace_on_ip and rec.ip and existing_by_mac:
-            stale_ip_ids = {
-                d.get("id") for d in ip_matches
-                if d.get("id") and (d.get("mac") or "").lower() != rec.mac.lower()
-            }
-            if stale_ip_ids:
-                database["devices"] = [
-                    d for d in database["devices"]
-                    if d.get("id") not in stale_ip_ids
-                ]
-
-        existing = existing_by_mac
-        matched_by_mac = existing is not None
-        if not existing and ip_matches:
-            existing = next(
-                (
-                    d for d in ip_matches
-                    if (d.get("mac") or "").lower() == rec.mac.lower()
-                    or not (d.get("mac") or "").strip()
-                ),
-                None
-            )
-            if existing is None:
-                existing = ip_matches[0]
-            matched_by_mac = False
-
-        if replace_on_ip and existing and rec.ip:
-            stale_ip_ids = {
-                d.get("id") for d in ip_matches
-                if d.get("id")
-                and d.get("id") != existing.get("id")
-                and (d.get("mac") or "").lower() != rec.mac.lower()
-            }
-            if stale_ip_ids:
-                database["devices"] = [
-                    d for d in database["devices"]
-                    if d.get("id") not in stale_ip_ids
-                ]
-
-        if not existing and not replace_on_ip and rec.ip:
-            existing_same_ip_mac = next(
-                (
-                    d for d in database["devices"]
-                    if d.get("site") == site_name
-                    and d.get("ip") == rec.ip
-                    and (d.get("mac") or "").lower() == rec.mac.lower()
-                ),
-                None
-            )
-            if existing_same_ip_mac:
-                existing = existing_same_ip_mac
-                matched_by_mac = True
-
-        if existing:
-            if existing.get("locked"):
-                continue
-            touched_device_ids.add(existing.get("id") or "")
-            existing_name = existing.get("name") or ""
-            dtype = (existing.get("type") or "").strip().lower()
-            changed = False
-            if matched_by_mac or replace_on_ip:
-                new_name = preferred_name_for_record(rec, dtype, existing_name)
-                if new_name and existing.get("name") != new_name:
-                    existing["name"] = new_name
-                    changed = True
-                updates = {
-                    "ip": rec.ip or existing.get("ip"),
-                    "vendor": rec.vendor or existing.get("vendor"),
-                    "mac": rec.mac,
-                    "oui": rec.oui or existing.get("oui"),
-                    "discovered_by": "mikrotik_mac_discovery"
-                }
-            else:
-                updates = {}
-                if not existing.get("ip") and rec.ip:
-                    updates["ip"] = rec.ip
-                if not existing.get("vendor") and rec.vendor:
-                    updates["vendor"] = rec.vendor
-                if not existing.get("mac") and rec.mac:
-                    updates["mac"] = rec.mac
-                if not existing.get("oui") and rec.oui:
-                    updates["oui"] = rec.oui
-                if not existing.get("discovered_by"):
-                    updates["discovered_by"] = "mikrotik_mac_discovery"
-                if not existing_name:
-                    new_name = preferred_name_for_record(rec, dtype, existing_name)
-                    if new_name:
-                        updates["name"] = new_name
-            for key, value in updates.items():
-                if value is not None and existing.get(key) != value:
-                    existing[key] = value
-                    changed = True
-            if note and replace_on_ip:
-                existing["notes"] = f"{existing.get('notes', '')} {note}".strip()
-                changed = True
-            existing["last_seen"] = now
-            if changed:
-                existing["last_modified"] = now
-            devices_updated += 1
-        else:
-            name_value = rec.name
-            if rec.dhcp_name and not rec.catch_ip_thief:
-                name_value = rec.dhcp_name
-            elif rec.catch_ip_thief:
-                name_value = f"Catched-{rec.scan_name}" if not is_truncated_name(rec.scan_name) else rec.mac
-            database["devices"].append({
-                "id": device_id,
-                "site": site_name,
-                "name": name_value,
-                "ip": rec.ip,
-                "mac": rec.mac,
-                "vendor": rec.vendor,
-                "oui": rec.oui,
-                "type": "unknown",
-                "model": "",
-                "platform": "",
-                "capabilities": "",
-                "discovered_by": "mikrotik_mac_discovery",
-                "discovered_at": now,
-                "last_seen": now,
-                "last_modified": now,
-                "notes": note or ""
-            })
-            touched_device_ids.add(device_id)
-            devices_added += 1
-
-    availability_updated = 0
-    if seen_ips:
-        for device in database.get("devices", []):
-            if device.get("site") != site_name:
-                continue
-            if device.get("locked"):
-                continue
-            device_id_existing = device.get("id") or ""
-            if device_id_existing in touched_device_ids:
-                continue
-            if (device.get("ip") or "").strip() not in seen_ips:
-                continue
-            device_mac = normalize_mac(device.get("mac") or "").lower() if device.get("mac") else ""
-            scan_macs = seen_ip_macs.get((device.get("ip") or "").strip(), set())
-            if device_mac and scan_macs and device_mac not in scan_macs:
-                continue
-            device["last_seen"] = now
-            touched_device_ids.add(device_id_existing)
-            availability_updated += 1
-        devices_updated += availability_updated
-
-    database.setdefault("meta", {})["last_modified"] = now
-    try:
-        write_json_store(db_path, "devices", database)
-    except Exception:
-        print(json.dumps({"status": "error", "message": "Failed to write database"}))
-        return
+        # Nothing added or refreshed means only meta.last_modified moved; leave
+        # the database untouched rather than rewriting it for that alone.
+        if standalone and (devices_added or devices_updated):
+            try:
+                write_json_store(db_path, "devices", database)
+            except Exception:
+                return {"status": "error", "message": "Failed to write database"}
 
     result_payload = {
         "status": "success",
@@ -1489,14 +1824,67 @@ def main() -> None:
         "devices_updated": devices_updated,
         "availability_updated": availability_updated,
         "devices": [r.to_output() for r in records],
-        "ran_at": datetime.now().isoformat()
+        "ran_at": now
     }
     if not records and scan_errors:
         result_payload["warnings"] = scan_errors[:3]
         print("=== ip-scan errors ===", file=sys.stderr)
         for err in scan_errors[:3]:
             print(err, file=sys.stderr)
-    print(json.dumps(result_payload))
+    return result_payload
+
+
+def run_batch(batch_path: str) -> Dict[str, Any]:
+    """Run a list of discovery configs, reading and writing each database once.
+
+    Back-to-back scans otherwise pay for a full devices.db read and rewrite
+    per site; here every config is merged into the same in-memory copy.
+    """
+    config_paths = load_config(batch_path)
+    if not isinstance(config_paths, list):
+        return {"status": "error", "message": "Batch file must contain a list of config files"}
+
+    databases: Dict[str, Optional[Dict[str, Any]]] = {}
+    changed_paths: set[str] = set()
+    results: List[Dict[str, Any]] = []
+    for config_path in config_paths:
+        config = load_config(config_path)
+        db_path = config.get("database_path")
+        if db_path and db_path not in databases:
+            databases[db_path] = read_json_store(db_path, "devices")
+        if db_path and databases[db_path] is None:
+            results.append({"status": "error", "message": "Failed to read database"})
+            continue
+        result = run_discovery(config, databases.get(db_path))
+        if result.get("devices_added") or result.get("devices_updated"):
+            changed_paths.add(db_path)
+        results.append(result)
+
+    status = "success"
+    for db_path, database in databases.items():
+        if database is None or db_path not in changed_paths:
+            continue
+        try:
+            write_json_store(db_path, "devices", database)
+        except Exception:
+            status = "error"
+            results.append({"status": "error", "message": f"Failed to write database {db_path}"})
+    return {"status": status, "results": results}
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        print(json.dumps({"status": "error", "message": "Config file required"}))
+        return
+
+    if sys.argv[1] == "--batch-file":
+        if len(sys.argv) < 3:
+            print(json.dumps({"status": "error", "message": "Batch file required"}))
+            return
+        print(json.dumps(run_batch(sys.argv[2])))
+        return
+
+    print(json.dumps(run_discovery(load_config(sys.argv[1]))))
 
 
 if __name__ == "__main__":
@@ -36,14 +36,14 @@ def _same_block(left, right):
     return False
 
 
-def add_block(database, device):
+def add_block(database, device, blocked_at=None):
     block = {
         "id": device.get("id") or "",
         "site": device.get("site") or "",
         "ip": device.get("ip") or "",
         "mac": normalize_mac(device.get("mac") or ""),
         "name": device.get("name") or "",
-        "blocked_at": datetime.now().isoformat(),
+        "blocked_at": blocked_at or datetime.now().isoformat(),
         "blocked_by": "remove_device",
     }
     meta = database.setdefault("meta", {})
@@ -111,23 +111,21 @@ def main():
     if not keep_dependents:
         remove_ids.update(dependents)
 
+    stamp = datetime.now().isoformat()
     kept_devices = []
     for device in devices:
-        if device.get("id") in remove_ids and device.get("site") == site_name:
-            if block_rediscovery:
-                add_block(database, device)
-            continue
+        if device.get("site") == site_name:
+            if device.get("id") in remove_ids:
+                if block_rediscovery:
+                    add_block(database, device, stamp)
+                continue
+            connections = device.get("connections") or []
+            device["connections"] = [
+                conn for conn in connections if conn.get("remote_device") not in remove_ids
+            ]
+            device["last_modified"] = stamp
         kept_devices.append(device)
 
-    for device in kept_devices:
-        if device.get("site") != site_name:
-            continue
-        connections = device.get("connections") or []
-        device["connections"] = [
-            conn for conn in connections if conn.get("remote_device") not in remove_ids
-        ]
-        device["last_modified"] = datetime.now().isoformat()
-
     database["devices"] = kept_devices
 
     try:
@@ -8,15 +8,20 @@ with parent switch name/IP/port and VLAN. Overrides fields because CDP is author
 
 from __future__ import annotations
 
+import atexit
 import json
 import os
+import random
 import re
+import socket
+import struct
 import sys
-import uuid
+import threading
+import time
 import warnings
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 SHARED_DIR = os.path.abspath(os.path.join(MODULE_DIR, "..", "_shared"))
@@ -24,6 +29,25 @@ if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
 from sqlite_store import read_json_store, write_json_store
 
+_PORT3_RE = re.compile(r"(\d+/\d+/\d+)$")
+_PORT2_RE = re.compile(r"(\d+/\d+)$")
+_NON_HEX_RE = re.compile(r"[^0-9a-fA-F]")
+_HEXLINE_RE = re.compile(r"^[ \t]*0x([^\n]*)", re.MULTILINE)
+_TCPDUMP_TIME_RE = re.compile(r"^\d{2}:\d{2}:\d{2}\.")
+# Log lines are buffered and appended in chunks instead of one open() per line.
+# A chunk is also written once it is a second old so the live log keeps up.
+_LOG_FLUSH_LINES = 64
+_LOG_FLUSH_SECONDS = 1.0
+_LOG_BUF: List[str] = []
+_LOG_LOCK = threading.Lock()
+_LOG_STARTED: List[float] = []
+# Record ids only need to be unique within the site, not unpredictable.
+_ID_RANDOM = random.Random()
+# Firmware-dependent commands that print the AP hostname/model, in probe order.
+_AP_INFO_COMMANDS = ("info", "mca-cli-op info", "ubnt-device-info", "/usr/bin/ubnt-device-info")
+# Which of those worked per AP, kept next to the module log rather than in the device records.
+_AP_INFO_CACHE_NAME = "ubiquiti_ap_info_commands.json"
+
 
 def load_config(path: str) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
@@ -38,6 +62,35 @@ def save_json(path: str, data: Dict[str, Any]) -> None:
     write_json_store(path, "devices", data)
 
 
+def _load_info_commands(path: Optional[str]) -> Dict[str, str]:
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cached, dict):
+        return {}
+    return {key: cmd for key, cmd in cached.items() if cmd in _AP_INFO_COMMANDS}
+
+
+def _save_info_commands(path: Optional[str], commands: Dict[str, str]) -> None:
+    if not path:
+        return
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(commands, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def _short_id() -> str:
+    return f"{_ID_RANDOM.getrandbits(32):08x}"
+
+
 def normalize_mac(mac: str) -> str:
     mac = mac.strip().replace("-", ":").replace(".", "")
     if len(mac) == 12:
@@ -45,48 +98,97 @@ def normalize_mac(mac: str) -> str:
     return mac.upper()
 
 
-def run_paramiko_cmd(host: str, username: str, password: str, cmd: str, timeout: int) -> Tuple[int, str, str]:
-    try:
-        warnings.filterwarnings("ignore", message=r"TripleDES has been moved.*")
-        import paramiko
-    except Exception as exc:
-        raise RuntimeError("paramiko is required for SSH") from exc
-
-    client = paramiko.SSHClient()
-    stdin = stdout = stderr = None
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    try:
-        client.connect(
-            host,
-            username=username,
-            password=password,
-            timeout=10,
-            banner_timeout=10,
-            auth_timeout=10
-        )
-        stdin, stdout, stderr = client.exec_command(cmd, timeout=timeout)
-        out_text = stdout.read().decode(errors="ignore")
-        err_text = stderr.read().decode(errors="ignore")
-        exit_status = stdout.channel.recv_exit_status()
-        return exit_status, out_text, err_text
-    finally:
-        for stream in (stdin, stdout, stderr):
-            if stream is not None:
-                try:
-                    stream.close()
-                except Exception:
-                    pass
-        client.close()
+class SSHSession:
+    """One authenticated SSH connection, reused for every command sent to a host."""
+
+    def __init__(self, host: str, username: str, password: str) -> None:
+        try:
+            warnings.filterwarnings("ignore", message=r"TripleDES has been moved.*")
+            import paramiko
+        except Exception as exc:
+            raise RuntimeError("paramiko is required for SSH") from exc
+
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            self.client.connect(
+                host,
+                username=username,
+                password=password,
+                timeout=10,
+                banner_timeout=10,
+                auth_timeout=10
+            )
+        except Exception:
+            self.client.close()
+            raise
+
+    def __enter__(self) -> "SSHSession":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def start(self, cmd: str, timeout: int) -> Tuple[Any, Any, Any]:
+        """Open a channel for cmd and return its streams without waiting for it."""
+        return self.client.exec_command(cmd, timeout=timeout)
+
+    def collect(self, streams: Tuple[Any, Any, Any]) -> Tuple[int, str, str]:
+        stdin, stdout, stderr = streams
+        try:
+            out_text = stdout.read().decode(errors="ignore")
+            err_text = stderr.read().decode(errors="ignore")
+            exit_status = stdout.channel.recv_exit_status()
+            return exit_status, out_text, err_text
+        finally:
+            for stream in (stdin, stdout, stderr):
+                if stream is not None:
+                    try:
+                        stream.close()
+                    except Exception:
+                        pass
+
+    def run(self, cmd: str, timeout: int) -> Tuple[int, str, str]:
+        return self.collect(self.start(cmd, timeout))
+
+    def close(self) -> None:
+        self.client.close()
 
 
 def _append_log(path: Optional[str], message: str) -> None:
     if not path:
         return
+    now = time.monotonic()
+    with _LOG_LOCK:
+        if not _LOG_BUF:
+            _LOG_STARTED[:] = [now]
+        _LOG_BUF.append(message.rstrip() + "\n")
+        if len(_LOG_BUF) >= _LOG_FLUSH_LINES or now - _LOG_STARTED[0] >= _LOG_FLUSH_SECONDS:
+            _write_log_buffer(path)
+
+
+def _flush_log(path: Optional[str]) -> None:
+    if not path:
+        return
+    with _LOG_LOCK:
+        _write_log_buffer(path)
+
+
+def _write_log_buffer(path: str) -> None:
+    # Caller holds _LOG_LOCK.
+    if not _LOG_BUF:
+        return
     try:
         with open(path, "a", encoding="utf-8") as f:
-            f.write(message.rstrip() + "\n")
+            f.writelines(_LOG_BUF)
     except Exception:
         pass
+    _LOG_BUF.clear()
+
+
+def _join_output(out: str, err: str) -> str:
+    # tcpdump runs with 2>&1, so stderr is usually empty; skip copying stdout then.
+    return out + "\n" + err if err else out
 
 
 def extract_hex_blocks(output: str) -> list[bytes]:
@@ -95,30 +197,34 @@ def extract_hex_blocks(output: str) -> list[bytes]:
     """
     blocks: list[bytes] = []
     current = bytearray()
-    for line in output.splitlines():
-        line = line.strip()
-        if not line.startswith("0x"):
-            if current:
-                blocks.append(bytes(current))
-                current = bytearray()
+    last_end = -1
+    for match in _HEXLINE_RE.finditer(output):
+        # Any other line between two hex lines ends the current block.
+        if current and match.start() != last_end + 1:
+            blocks.append(bytes(current))
+            del current[:]
+        last_end = match.end()
+        _, sep, hex_part = match.group(1).partition(":")
+        if not sep:
             continue
-        try:
-            hex_part = line.split(":", 1)[1].strip()
-        except IndexError:
-            continue
-        hex_part = hex_part.split("  ")[0].strip()
-        hex_part = hex_part.replace(" ", "")
+        hex_part = hex_part.strip().split("  ")[0].strip().replace(" ", "")
         if len(hex_part) < 2:
             continue
-        for i in range(0, len(hex_part), 2):
-            chunk = hex_part[i:i+2]
-            if len(chunk) == 2:
-                current.append(int(chunk, 16))
+        if len(hex_part) % 2:
+            hex_part = hex_part[:-1]
+        try:
+            current += bytes.fromhex(hex_part)
+        except ValueError:
+            continue
     if current:
         blocks.append(bytes(current))
     return blocks
 
 
+def _cstr(value: memoryview) -> str:
+    return value.tobytes().partition(b"\x00")[0].decode(errors="ignore").strip()
+
+
 def parse_cdp(payload: bytes) -> Dict[str, Any]:
     """
     Parse CDP TLVs from payload, return device_id, port_id, platform, vlan, ip.
@@ -128,28 +234,28 @@ def parse_cdp(payload: bytes) -> Dict[str, Any]:
     idx = payload.find(snap)
     if idx == -1:
         return result
-    cdp = payload[idx + len(snap):]
+    # Slice TLVs out of a memoryview so only decoded strings get copied.
+    cdp = memoryview(payload)[idx + len(snap):]
     if len(cdp) < 4:
         return result
     offset = 4  # version(1), ttl(1), checksum(2)
     while offset + 4 <= len(cdp):
-        t = int.from_bytes(cdp[offset:offset+2], "big")
-        l = int.from_bytes(cdp[offset+2:offset+4], "big")
+        t, l = struct.unpack_from(">HH", cdp, offset)
         if l < 4 or offset + l > len(cdp):
             break
         value = cdp[offset+4:offset+l]
         if t == 0x0001:  # Device ID
-            result["device_id"] = value.split(b"\x00")[0].decode(errors="ignore").strip()
+            result["device_id"] = _cstr(value)
         elif t == 0x0003:  # Port ID
-            result["port_id"] = value.split(b"\x00")[0].decode(errors="ignore").strip()
+            result["port_id"] = _cstr(value)
         elif t == 0x0006:  # Platform
-            result["platform"] = value.split(b"\x00")[0].decode(errors="ignore").strip()
+            result["platform"] = _cstr(value)
         elif t == 0x000a:  # Native VLAN
             if len(value) >= 2:
-                result["vlan"] = int.from_bytes(value[:2], "big")
+                result["vlan"] = struct.unpack_from(">H", value)[0]
         elif t == 0x0002:  # Address
             if len(value) >= 4:
-                count = int.from_bytes(value[:4], "big")
+                count = struct.unpack_from(">I", value)[0]
                 cursor = 4
                 for _ in range(count):
                     if cursor + 2 > len(value):
@@ -159,14 +265,14 @@ def parse_cdp(payload: bytes) -> Dict[str, Any]:
                     cursor += 2 + plen
                     if cursor + 2 > len(value):
                         break
-                    addr_len = int.from_bytes(value[cursor:cursor+2], "big")
+                    addr_len = struct.unpack_from(">H", value, cursor)[0]
                     cursor += 2
                     if cursor + addr_len > len(value):
                         break
                     addr = value[cursor:cursor+addr_len]
                     cursor += addr_len
                     if ptype == 0x01 and addr_len == 4:
-                        result["ip"] = ".".join(str(b) for b in addr)
+                        result["ip"] = socket.inet_ntoa(addr)
                         break
         offset += l
     return result
@@ -185,7 +291,7 @@ def parse_cdp_text(output: str) -> Dict[str, Any]:
         return {}
     details: list[str] = []
     for line in lines[start_idx + 1:]:
-        if re.match(r"^\d{2}:\d{2}:\d{2}\.", line):
+        if _TCPDUMP_TIME_RE.match(line):
             break
         if line.startswith("tcpdump:") or line.startswith("START ") or line.startswith("END "):
             break
@@ -220,10 +326,7 @@ def parse_cdp_text(output: str) -> Dict[str, Any]:
 def short_port(port: Optional[str]) -> str:
     if not port:
         return ""
-    match = re.search(r"(\d+/\d+/\d+)$", port)
-    if match:
-        return match.group(1)
-    match = re.search(r"(\d+/\d+)$", port)
+    match = _PORT3_RE.search(port) or _PORT2_RE.search(port)
     if match:
         return match.group(1)
     return port
@@ -239,8 +342,7 @@ def is_ubiquiti_device(device: Dict[str, Any]) -> bool:
 def _is_mac_like(value: str) -> bool:
     if not value:
         return False
-    cleaned = re.sub(r"[^0-9a-fA-F]", "", value)
-    return len(cleaned) == 12
+    return len(_NON_HEX_RE.sub("", value)) == 12
 
 
 def _switch_name_from_cdp(cdp: Dict[str, Any]) -> str:
@@ -278,47 +380,76 @@ def _parse_ap_info(output: str) -> Dict[str, str]:
     return info
 
 
+class SiteDeviceIndex:
+    """Devices of one site keyed by IP and by name/id, in database order.
+
+    Buckets may hold devices whose IP or name has since changed; lookups
+    re-check the live values, so callers only need to add() after an edit.
+    """
+
+    def __init__(self, devices: List[Dict[str, Any]], site_name: str) -> None:
+        self._order: Dict[int, int] = {}
+        self._by_ip: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_name: Dict[str, List[Dict[str, Any]]] = {}
+        for device in devices:
+            if device.get("site") == site_name:
+                self.add(device)
+
+    def add(self, device: Dict[str, Any]) -> None:
+        self._order.setdefault(id(device), len(self._order))
+        keys = [(self._by_ip, device.get("ip")), (self._by_name, device.get("name")), (self._by_name, device.get("id"))]
+        for index, key in keys:
+            if not key:
+                continue
+            bucket = index.setdefault(key, [])
+            if not any(d is device for d in bucket):
+                bucket.append(device)
+
+    def find(self, ip: Optional[str], name: str) -> Optional[Dict[str, Any]]:
+        candidates = []
+        if ip:
+            candidates.extend(d for d in self._by_ip.get(ip, []) if d.get("ip") == ip)
+        if name:
+            candidates.extend(
+                d for d in self._by_name.get(name, [])
+                if d.get("name") == name or d.get("id") == name
+            )
+        if not candidates:
+            return None
+        return min(candidates, key=lambda d: self._order[id(d)])
+
+
 def _find_or_create_switch(
     data: Dict[str, Any],
     site_name: str,
     cdp: Dict[str, Any],
     now: str,
-    override_existing: bool
+    override_existing: bool,
+    index: SiteDeviceIndex
 ) -> Optional[Dict[str, Any]]:
     switch_ip = cdp.get("ip")
     switch_name = _switch_name_from_cdp(cdp)
     if not switch_ip and not switch_name:
         return None
-    for device in data.get("devices", []):
-        if device.get("site") != site_name:
-            continue
-        if switch_ip and device.get("ip") == switch_ip:
-            if device.get("locked"):
-                return device
-            if override_existing:
-                device["name"] = switch_name or device.get("name")
-                if switch_ip:
-                    device["ip"] = switch_ip
-                if cdp.get("platform"):
-                    device["platform"] = cdp.get("platform")
-                    device["vendor"] = _vendor_from_platform(cdp.get("platform") or "")
-                device["last_modified"] = now
-            return device
-        if switch_name and (device.get("name") == switch_name or device.get("id") == switch_name):
-            if device.get("locked"):
-                return device
-            if override_existing:
-                if switch_ip:
-                    device["ip"] = switch_ip
-                if cdp.get("platform"):
-                    device["platform"] = cdp.get("platform")
-                    device["vendor"] = _vendor_from_platform(cdp.get("platform") or "")
-                device["last_modified"] = now
+    device = index.find(switch_ip, switch_name)
+    if device is not None:
+        if device.get("locked"):
             return device
+        if override_existing:
+            if switch_ip and device.get("ip") == switch_ip:
+                device["name"] = switch_name or device.get("name")
+            if switch_ip:
+                device["ip"] = switch_ip
+            if cdp.get("platform"):
+                device["platform"] = cdp.get("platform")
+                device["vendor"] = _vendor_from_platform(cdp.get("platform") or "")
+            device["last_modified"] = now
+            index.add(device)
+        return device
     platform = cdp.get("platform") or ""
     vendor = _vendor_from_platform(platform)
     new_device = {
-        "id": f"dev_{uuid.uuid4().hex[:8]}",
+        "id": f"dev_{_short_id()}",
         "site": site_name,
         "name": switch_name,
         "ip": switch_ip or "",
@@ -342,6 +473,7 @@ def _find_or_create_switch(
         "notes": "Placeholder from CDP capture"
     }
     data.setdefault("devices", []).append(new_device)
+    index.add(new_device)
     return new_device
 
 
@@ -361,7 +493,7 @@ def _upsert_connection(
                 conn["discovered_at"] = now
                 return
     connections.append({
-        "id": f"conn_{uuid.uuid4().hex[:8]}",
+        "id": f"conn_{_short_id()}",
         "local_interface": local_interface or "",
         "remote_device": remote_device_id,
         "remote_interface": remote_interface or "",
@@ -404,6 +536,14 @@ def main() -> None:
     concurrency = max(1, min(int(params.get("concurrency", 3) or 3), 60))
     trace_output = str(params.get("trace_output", "false")).strip().lower() in ("1", "true", "yes")
     override_existing = str(params.get("override_existing_switch", "false")).strip().lower() in ("1", "true", "yes")
+    # Write out whatever is still buffered if main() stops on an exception.
+    atexit.register(_flush_log, log_file)
+    if trace_output:
+        def trace(message: str) -> None:
+            _append_log(log_file, message)
+    else:
+        def trace(message: str) -> None:
+            pass
     targets = params.get("targets") or {}
     device_ids = targets.get("device_ids") or []
     manual_devices = targets.get("manual_devices") or []
@@ -447,7 +587,7 @@ def main() -> None:
                     devices.append(existing_by_ip[ip])
                 continue
             placeholder = {
-                "id": f"dev_{os.urandom(4).hex()}",
+                "id": f"dev_{_short_id()}",
                 "site": site_name,
                 "name": name or ip,
                 "ip": ip,
@@ -491,6 +631,10 @@ def main() -> None:
             }))
         return
 
+    info_cache_path = os.path.join(os.path.dirname(os.path.abspath(log_file)), _AP_INFO_CACHE_NAME) if log_file else None
+    info_commands = _load_info_commands(info_cache_path)
+    cached_info_commands = dict(info_commands)
+
     cmd = (
         "sh -c '"
         "tmp=/tmp/cdp_capture_$$.log; "
@@ -505,30 +649,42 @@ def main() -> None:
         "cat $tmp; rm -f $tmp'"
     )
 
-    def process_device(dev: Dict[str, Any]) -> Tuple[str, Optional[str], bool, str]:
+    def process_device(dev: Dict[str, Any]) -> Tuple[str, Optional[str], bool, str, Optional[Dict[str, Any]]]:
         host = dev.get("ip")
         name = dev.get("name") or dev.get("id") or host or "unknown"
         if dev.get("locked"):
-            return name, host, False, "locked"
+            return name, host, False, "locked", None
         if not host:
-            return name, None, False, "missing_ip"
+            return name, None, False, "missing_ip", None
         try:
-            info_text = ""
-            ap_info = {}
-            for info_cmd in ("info", "mca-cli-op info", "ubnt-device-info", "/usr/bin/ubnt-device-info"):
-                info_code, info_out, info_err = run_paramiko_cmd(
-                    host, username, password, info_cmd, timeout=10
-                )
-                info_text = info_out + "\n" + info_err
-                ap_info = _parse_ap_info(info_text)
-                if ap_info:
-                    break
-            if trace_output and info_text:
-                _append_log(log_file, f"INFO {host}:\n{info_text[:1200]}")
-            code, out, err = run_paramiko_cmd(host, username, password, cmd, timeout=capture_seconds + 5)
+            with SSHSession(host, username, password) as session:
+                # The capture mostly sleeps, so start it first and run the info
+                # probes on their own channels of the same connection meanwhile.
+                capture = session.start(cmd, timeout=capture_seconds + 5)
+                info_text = ""
+                ap_info = {}
+                # Try the command that worked for this AP last time first.
+                cache_key = dev.get("id") or host
+                preferred = info_commands.get(cache_key)
+                info_cmds = _AP_INFO_COMMANDS
+                if preferred in _AP_INFO_COMMANDS:
+                    info_cmds = (preferred,) + tuple(c for c in _AP_INFO_COMMANDS if c != preferred)
+                for info_cmd in info_cmds:
+                    info_code, info_out, info_err = session.run(info_cmd, timeout=10)
+                    info_text = _join_output(info_out, info_err)
+                    ap_info = _parse_ap_info(info_text)
+                    if ap_info:
+                        info_commands[cache_key] = info_cmd
+                        break
+                if trace_output and info_text:
+                    trace(f"INFO {host}:\n{info_text[:1200]}")
+                # Buffered lines only age out on the next append; write them
+                # out before blocking on the rest of the capture.
+                _flush_log(log_file)
+                code, out, err = session.collect(capture)
         except Exception as exc:
             _append_log(log_file, f"SSH ERROR {host}: {type(exc).__name__}: {str(exc)[:180]}")
-            return name, host, False, "ssh_failed"
+            return name, host, False, "ssh_failed", None
         hostname = ap_info.get("hostname")
         if hostname:
             current_name = (dev.get("name") or "").strip()
@@ -544,42 +700,14 @@ def main() -> None:
         model = ap_info.get("model")
         if model:
             dev["model"] = model
-        output = out + "\n" + err
+        output = _join_output(out, err)
         if trace_output:
-            _append_log(log_file, f"RAW {host}:\n{output[:2000]}")
+            trace(f"RAW {host}:\n{output[:2000]}")
         if "pid CDP" not in output and "CDPv" not in output:
-            if trace_output:
-                _append_log(log_file, f"PARSE FAIL {host} ({name}): no CDP packet")
-            return name, host, False, "no_cdp_packet"
+            trace(f"PARSE FAIL {host} ({name}): no CDP packet")
+            return name, host, False, "no_cdp_packet", None
 
         blocks = extract_hex_blocks(output)
-        if not blocks:
-            cdp = parse_cdp_text(output)
-            if cdp:
-                dev["parent_switch_name"] = cdp.get("device_id") or dev.get("parent_switch_name")
-                dev["parent_switch_ip"] = cdp.get("ip") or dev.get("parent_switch_ip")
-                port_id = cdp.get("port_id") or dev.get("parent_switch_port")
-                dev["parent_switch_port"] = port_id
-                if "vlan" in cdp:
-                    dev["vlan"] = str(cdp["vlan"])
-                if cdp.get("platform"):
-                    dev["parent_switch_platform"] = cdp.get("platform")
-                switch_device = _find_or_create_switch(data, site_name, cdp, now, override_existing)
-                if switch_device:
-                    _upsert_connection(dev, switch_device["id"], interface, port_id or "", now)
-                dev["last_modified"] = now
-                if trace_output:
-                    _append_log(log_file, f"PARSED {host}: {cdp}")
-                else:
-                    port_display = short_port(port_id)
-                    _append_log(
-                        log_file,
-                        f"FOUND {name} ({host}) -> switch={cdp.get('device_id')} port={port_display} vlan={cdp.get('vlan')}"
-                    )
-                return name, host, True, "ok"
-            if trace_output:
-                _append_log(log_file, f"PARSE FAIL {host} ({name}): no hex payload")
-            return name, host, False, "no_hex"
         cdp = None
         for payload in blocks:
             parsed = parse_cdp(payload)
@@ -589,9 +717,11 @@ def main() -> None:
         if not cdp:
             cdp = parse_cdp_text(output)
         if not cdp:
-            if trace_output:
-                _append_log(log_file, f"PARSE FAIL {host} ({name}): no CDP TLVs")
-            return name, host, False, "no_cdp_tlv"
+            if blocks:
+                trace(f"PARSE FAIL {host} ({name}): no CDP TLVs")
+                return name, host, False, "no_cdp_tlv", None
+            trace(f"PARSE FAIL {host} ({name}): no hex payload")
+            return name, host, False, "no_hex", None
 
         dev["parent_switch_name"] = cdp.get("device_id") or dev.get("parent_switch_name")
         dev["parent_switch_ip"] = cdp.get("ip") or dev.get("parent_switch_ip")
@@ -601,31 +731,38 @@ def main() -> None:
             dev["vlan"] = str(cdp["vlan"])
         if cdp.get("platform"):
             dev["parent_switch_platform"] = cdp.get("platform")
-        switch_device = _find_or_create_switch(data, site_name, cdp, now, override_existing)
-        if switch_device:
-            _upsert_connection(dev, switch_device["id"], interface, port_id or "", now)
         dev["last_modified"] = now
         if trace_output:
-            _append_log(log_file, f"PARSED {host}: {cdp}")
+            trace(f"PARSED {host}: {cdp}")
         else:
             port_display = short_port(port_id)
             _append_log(
                 log_file,
                 f"FOUND {name} ({host}) -> switch={cdp.get('device_id')} port={port_display} vlan={cdp.get('vlan')}"
             )
-        return name, host, True, "ok"
+        return name, host, True, "ok", cdp
 
+    switch_index = SiteDeviceIndex(data.get("devices", []), site_name)
     total = len(devices)
     _append_log(log_file, f"Starting CDP capture for {total} devices (batch size {batch_size}, parallel SSH {concurrency}).")
     ok_list = []
     fail_list = []
-    for start in range(0, total, batch_size):
-        batch = devices[start:start + batch_size]
-        _append_log(log_file, f"Batch {start + 1}-{start + len(batch)} starting...")
-        with ThreadPoolExecutor(max_workers=min(concurrency, len(batch))) as pool:
+    # One pool for the whole run; batches only pace the log output now.
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, total))) as pool:
+        for start in range(0, total, batch_size):
+            batch = devices[start:start + batch_size]
+            _append_log(log_file, f"Batch {start + 1}-{start + len(batch)} starting...")
             future_map = {pool.submit(process_device, dev): dev for dev in batch}
+            _flush_log(log_file)
             for future in as_completed(future_map):
-                name, host, ok, reason = future.result()
+                name, host, ok, reason, cdp = future.result()
+                if cdp:
+                    # Workers only touch their own device; shared switch records
+                    # are created and linked here, on the main thread.
+                    dev = future_map[future]
+                    switch_device = _find_or_create_switch(data, site_name, cdp, now, override_existing, switch_index)
+                    if switch_device:
+                        _upsert_connection(dev, switch_device["id"], interface, dev.get("parent_switch_port") or "", now)
                 if ok:
                     updated += 1
                     _append_log(log_file, f"OK: {name}")
@@ -634,7 +771,9 @@ def main() -> None:
                     label = f"{name} ({host})" if host else name
                     _append_log(log_file, f"FAIL: {label} ({reason})")
                     fail_list.append((name, host, reason))
-        _append_log(log_file, f"Batch {start + 1}-{start + len(batch)} complete.")
+                _flush_log(log_file)
+            _append_log(log_file, f"Batch {start + 1}-{start + len(batch)} complete.")
+            _flush_log(log_file)
 
     if ok_list:
         _append_log(log_file, "Success summary:")
@@ -647,6 +786,9 @@ def main() -> None:
         for name, host, reason in fail_list:
             label = f"{name} ({host})" if host else name
             _append_log(log_file, f"  FAIL: {label} ({reason})")
+    _flush_log(log_file)
+    if info_commands != cached_info_commands:
+        _save_info_commands(info_cache_path, info_commands)
 
     data.setdefault("meta", {})["last_modified"] = now
     try:
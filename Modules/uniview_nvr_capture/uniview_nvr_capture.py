@@ -7,32 +7,82 @@ Logs in via LAPI (Digest auth), starts capture, waits, then downloads pcap.
 
 from __future__ import annotations
 
+import contextlib
+import functools
+import io
 import json
+import mmap
 import os
 import ipaddress
 import re
+import socket
 import struct
 import sys
+import threading
 import time
+from collections import Counter
 from datetime import datetime
-from typing import Any, Dict, Optional, Tuple, List
+from typing import Any, Dict, Optional, Tuple, List, Union
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 SHARED_DIR = os.path.abspath(os.path.join(MODULE_DIR, "..", "_shared"))
 if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
-from sqlite_store import read_json_store, write_json_store
+from sqlite_store import read_json_store, write_json_store
 
+MAX_CAPTURE_WORKERS = 32
+_TL_STRUCT = struct.Struct(">HH")
+_U16BE_STRUCT = struct.Struct(">H")
+_U32BE_STRUCT = struct.Struct(">I")
+_DOWNLOAD_CHUNK = 128 * 1024
+# Captures up to this size are parsed straight from memory; larger ones go to disk.
+_MAX_MEMORY_CAPTURE = 64 * 1024 * 1024
+# LLC/SNAP header for Cisco OUI; the byte after it picks CDP (0x00/0x02) or DTP (0x04).
+_SNAP_PREFIX = b"\xaa\xaa\x03\x00\x00\x0c\x20"
+# Every CDP field parse_cdp_at extracts; once all are set the rest of the TLVs are skipped.
+_CDP_FIELDS = frozenset(("device_id", "port_id", "platform", "vlan", "ip"))
+# Log lines are buffered and appended in chunks instead of one open() per line.
+# A chunk is also written once it is a second old so the live log keeps up.
+_LOG_FLUSH_LINES = 64
+_LOG_FLUSH_SECONDS = 1.0
+_LOG_BUF: List[str] = []
+_LOG_LOCK = threading.Lock()
+_LOG_STARTED: List[float] = []
+_NIC_RE = re.compile(r"nic", re.IGNORECASE)
+# SUMMARY counter for each failure reason from capture_device; anything else is a capture_fail.
+_FAIL_REASON_COUNTERS = {"no_cdp": "no_cdp", "login_fail_401": "auth_fail", "login_fail_403": "auth_fail"}
 
-def _append_log(path: Optional[str], message: str) -> None:
+
+def _append_log(path: Optional[str], message: str) -> None:
     if not path:
         return
+    now = time.monotonic()
+    with _LOG_LOCK:
+        if not _LOG_BUF:
+            _LOG_STARTED[:] = [now]
+        _LOG_BUF.append(message.rstrip() + "\n")
+        if len(_LOG_BUF) >= _LOG_FLUSH_LINES or now - _LOG_STARTED[0] >= _LOG_FLUSH_SECONDS:
+            _write_log_buffer(path)
+
+
+def _flush_log(path: Optional[str]) -> None:
+    if not path:
+        return
+    with _LOG_LOCK:
+        _write_log_buffer(path)
+
+
+def _write_log_buffer(path: str) -> None:
+    # Caller holds _LOG_LOCK.
+    if not _LOG_BUF:
+        return
     try:
         with open(path, "a", encoding="utf-8") as f:
-            f.write(message.rstrip() + "\n")
+            f.writelines(_LOG_BUF)
     except Exception:
-        pass
+        pass
+    _LOG_BUF.clear()
 
 
 def load_config(path: str) -> Dict[str, Any]:
@@ -48,6 +98,7 @@ def save_json(path: str, data: Dict[str, Any]) -> None:
     write_json_store(path, "devices", data)
 
 
+@functools.lru_cache(maxsize=4096)
 def normalize_mac(mac: str) -> str:
     mac = mac.strip().replace("-", ":").replace(".", "")
     if len(mac) == 12:
@@ -55,6 +106,7 @@ def normalize_mac(mac: str) -> str:
     return mac.upper()
 
 
+@functools.lru_cache(maxsize=4096)
 def _is_mac_like(value: str) -> bool:
     if not value:
         return False
@@ -67,19 +119,22 @@ def _is_mac_like(value: str) -> bool:
 
 
 def parse_cdp(payload: bytes) -> Dict[str, Any]:
+    return parse_cdp_at(payload, payload.find(_SNAP_PREFIX))
+
+
+def parse_cdp_at(payload: bytes, idx: int) -> Dict[str, Any]:
+    """Parse CDP/DTP from payload whose first SNAP prefix is at idx (-1 if absent)."""
     result: Dict[str, Any] = {}
     dest_pattern = b"\x01\x00\x0c\xcc\xcc\xcc"
     idx_dest = payload.find(dest_pattern)
     if idx_dest >= 6:
         src = payload[idx_dest - 6:idx_dest]
-        result["switch_mac"] = ":".join(f"{b:02x}" for b in src)
-    snap_prefix = b"\xaa\xaa\x03\x00\x00\x0c\x20"
-    idx = payload.find(snap_prefix)
+        result["switch_mac"] = src.hex(":")
     if idx == -1:
         return result
     if idx + 8 > len(payload):
         return result
-    pid = int.from_bytes(payload[idx + 6:idx + 8], "big")
+    pid = _U16BE_STRUCT.unpack_from(payload, idx + 6)[0]
     if pid == 0x2004:
         return parse_dtp(payload, idx + 8)
     if pid not in (0x2000, 0x2002):
@@ -89,8 +144,7 @@ def parse_cdp(payload: bytes) -> Dict[str, Any]:
         return result
     offset = 4  # version(1), ttl(1), checksum(2)
     while offset + 4 <= len(cdp):
-        t = int.from_bytes(cdp[offset:offset+2], "big")
-        l = int.from_bytes(cdp[offset+2:offset+4], "big")
+        t, l = _TL_STRUCT.unpack_from(cdp, offset)
         if l < 4 or offset + l > len(cdp):
             break
         value = cdp[offset+4:offset+l]
@@ -102,10 +156,10 @@ def parse_cdp(payload: bytes) -> Dict[str, Any]:
             result["platform"] = value.split(b"\x00")[0].decode(errors="ignore").strip()
         elif t == 0x000a:  # Native VLAN
             if len(value) >= 2:
-                result["vlan"] = int.from_bytes(value[:2], "big")
+                result["vlan"] = _U16BE_STRUCT.unpack_from(value, 0)[0]
         elif t == 0x0002:  # Address
             if len(value) >= 4:
-                count = int.from_bytes(value[:4], "big")
+                count = _U32BE_STRUCT.unpack_from(value, 0)[0]
                 cursor = 4
                 for _ in range(count):
                     if cursor + 2 > len(value):
@@ -115,15 +169,17 @@ def parse_cdp(payload: bytes) -> Dict[str, Any]:
                     cursor += 2 + plen
                     if cursor + 2 > len(value):
                         break
-                    addr_len = int.from_bytes(value[cursor:cursor+2], "big")
+                    addr_len = _U16BE_STRUCT.unpack_from(value, cursor)[0]
                     cursor += 2
                     if cursor + addr_len > len(value):
                         break
                     addr = value[cursor:cursor+addr_len]
                     cursor += addr_len
                     if ptype == 0x01 and addr_len == 4:
-                        result["ip"] = ".".join(str(b) for b in addr)
+                        result["ip"] = socket.inet_ntoa(addr)
                         break
+        if _CDP_FIELDS <= result.keys():
+            break
         offset += l
     if result:
         result["protocol"] = "cdp"
@@ -138,14 +194,14 @@ def parse_dtp(payload: bytes, start: int) -> Dict[str, Any]:
     if idx == -1 or idx + 4 + 6 > len(data):
         return result
     mac_bytes = data[idx + 4:idx + 10]
-    mac = ":".join(f"{b:02x}" for b in mac_bytes)
+    mac = mac_bytes.hex(":")
     result["dtp_neighbor_mac"] = mac
     result["device_id"] = normalize_mac(mac)
     result["protocol"] = "dtp"
     return result
 
 
-def _parse_pcap_raw(path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+def _parse_pcap_raw(buf: bytes) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
     stats = {
         "format": "pcap",
         "linktype": None,
@@ -161,53 +217,59 @@ def _parse_pcap_raw(path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]
     }
     try:
         first_dtp = None
-        with open(path, "rb") as f:
-            header = f.read(24)
-            if len(header) < 24:
-                return None, stats
-            magic_bytes = header[:4]
-            if magic_bytes in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
-                endian = ">"
-            elif magic_bytes in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
-                endian = "<"
-            else:
-                return None, stats
-            stats["linktype"] = struct.unpack(endian + "I", header[20:24])[0]
-            while True:
-                pkt_hdr = f.read(16)
-                if len(pkt_hdr) < 16:
-                    break
-                ts_sec, ts_usec, incl_len, orig_len = struct.unpack(endian + "IIII", pkt_hdr)
-                data = f.read(incl_len)
-                if len(data) < incl_len:
-                    break
-                stats["packets"] += 1
-                if stats["packets"] == 1:
-                    stats["first_packet_hex"] = data[:64].hex()
-                dest_idx = data.find(b"\x01\x00\x0c\xcc\xcc\xcc")
-                if dest_idx != -1:
-                    stats["dest_hits"] += 1
-                    if stats["first_dest_packet"] is None:
-                        stats["first_dest_packet"] = stats["packets"]
-                        stats["first_dest_offset"] = dest_idx
-                snap_idx = data.find(b"\xaa\xaa\x03\x00\x00\x0c\x20\x00")
-                if snap_idx != -1:
-                    stats["snap_hits"] += 1
-                    if stats["first_snap_packet"] is None:
-                        stats["first_snap_packet"] = stats["packets"]
-                        stats["first_snap_offset"] = snap_idx
-                parsed = parse_cdp(data)
-                if parsed:
-                    if parsed.get("protocol") == "cdp":
-                        return parsed, stats
-                    if parsed.get("protocol") == "dtp" and first_dtp is None:
-                        first_dtp = parsed
+        header = buf[:24]
+        if len(header) < 24:
+            return None, stats
+        magic_bytes = header[:4]
+        if magic_bytes in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            endian = ">"
+        elif magic_bytes in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            endian = "<"
+        else:
+            return None, stats
+        stats["linktype"] = struct.unpack(endian + "I", header[20:24])[0]
+        pkt_hdr_struct = struct.Struct(endian + "IIII")
+        buf_len = len(buf)
+        offset = 24
+        while True:
+            if offset + 16 > buf_len:
+                break
+            ts_sec, ts_usec, incl_len, orig_len = pkt_hdr_struct.unpack_from(buf, offset)
+            data = buf[offset + 16:offset + 16 + incl_len]
+            if len(data) < incl_len:
+                break
+            offset += 16 + incl_len
+            stats["packets"] += 1
+            if stats["packets"] == 1:
+                stats["first_packet_hex"] = data[:64].hex()
+            dest_idx = data.find(b"\x01\x00\x0c\xcc\xcc\xcc")
+            if dest_idx != -1:
+                stats["dest_hits"] += 1
+                if stats["first_dest_packet"] is None:
+                    stats["first_dest_packet"] = stats["packets"]
+                    stats["first_dest_offset"] = dest_idx
+            # Only frames carrying the Cisco SNAP prefix can hold CDP/DTP.
+            prefix_idx = data.find(_SNAP_PREFIX)
+            if prefix_idx == -1:
+                continue
+            snap_idx = data.find(b"\xaa\xaa\x03\x00\x00\x0c\x20\x00", prefix_idx)
+            if snap_idx != -1:
+                stats["snap_hits"] += 1
+                if stats["first_snap_packet"] is None:
+                    stats["first_snap_packet"] = stats["packets"]
+                    stats["first_snap_offset"] = snap_idx
+            parsed = parse_cdp_at(data, prefix_idx)
+            if parsed:
+                if parsed.get("protocol") == "cdp":
+                    return parsed, stats
+                if parsed.get("protocol") == "dtp" and first_dtp is None:
+                    first_dtp = parsed
     except Exception:
         return None, stats
     return first_dtp, stats
 
 
-def _parse_pcapng_raw(path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+def _parse_pcapng_raw(buf: bytes) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
     stats = {
         "format": "pcapng",
         "linktype": None,
@@ -223,144 +285,238 @@ def _parse_pcapng_raw(path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, An
     }
     try:
         first_dtp = None
-        with open(path, "rb") as f:
-            header = f.read(12)
-            if len(header) < 12:
-                return None, stats
-            block_type = struct.unpack("<I", header[:4])[0]
-            if block_type != 0x0A0D0D0A:
-                return None, stats
-            bom = header[8:12]
-            if bom == b"\x4d\x3c\x2b\x1a":
-                endian = "<"
-            elif bom == b"\x1a\x2b\x3c\x4d":
-                endian = ">"
-            else:
-                return None, stats
-            f.seek(0)
-            while True:
-                block_header = f.read(8)
-                if len(block_header) < 8:
-                    break
-                btype, blen = struct.unpack(endian + "II", block_header)
-                if blen < 12:
-                    break
-                body = f.read(blen - 8)
-                if len(body) < blen - 8:
-                    break
-                if btype == 0x00000001 and len(body) >= 8:  # Interface Description Block
-                    stats["linktype"] = struct.unpack(endian + "H", body[:2])[0]
-                if btype == 0x00000006:  # Enhanced Packet Block
-                    if len(body) < 28:
-                        continue
-                    cap_len = struct.unpack(endian + "I", body[12:16])[0]
-                    packet_data = body[20:20 + cap_len]
-                    stats["packets"] += 1
-                    if stats["packets"] == 1:
-                        stats["first_packet_hex"] = packet_data[:64].hex()
-                    dest_idx = packet_data.find(b"\x01\x00\x0c\xcc\xcc\xcc")
-                    if dest_idx != -1:
-                        stats["dest_hits"] += 1
-                        if stats["first_dest_packet"] is None:
-                            stats["first_dest_packet"] = stats["packets"]
-                            stats["first_dest_offset"] = dest_idx
-                    snap_idx = packet_data.find(b"\xaa\xaa\x03\x00\x00\x0c\x20\x00")
-                    if snap_idx != -1:
-                        stats["snap_hits"] += 1
-                        if stats["first_snap_packet"] is None:
-                            stats["first_snap_packet"] = stats["packets"]
-                            stats["first_snap_offset"] = snap_idx
-                    parsed = parse_cdp(packet_data)
-                    if parsed:
-                        if parsed.get("protocol") == "cdp":
-                            return parsed, stats
-                        if parsed.get("protocol") == "dtp" and first_dtp is None:
-                            first_dtp = parsed
-                elif btype == 0x00000003:  # Simple Packet Block
-                    if len(body) < 8:
-                        continue
-                    packet_data = body[4:-4]
-                    stats["packets"] += 1
-                    if stats["packets"] == 1:
-                        stats["first_packet_hex"] = packet_data[:64].hex()
-                    dest_idx = packet_data.find(b"\x01\x00\x0c\xcc\xcc\xcc")
-                    if dest_idx != -1:
-                        stats["dest_hits"] += 1
-                        if stats["first_dest_packet"] is None:
-                            stats["first_dest_packet"] = stats["packets"]
-                            stats["first_dest_offset"] = dest_idx
-                    snap_idx = packet_data.find(b"\xaa\xaa\x03\x00\x00\x0c\x20\x00")
-                    if snap_idx != -1:
-                        stats["snap_hits"] += 1
-                        if stats["first_snap_packet"] is None:
-                            stats["first_snap_packet"] = stats["packets"]
-                            stats["first_snap_offset"] = snap_idx
-                    parsed = parse_cdp(packet_data)
-                    if parsed:
-                        if parsed.get("protocol") == "cdp":
-                            return parsed, stats
-                        if parsed.get("protocol") == "dtp" and first_dtp is None:
-                            first_dtp = parsed
+        header = buf[:12]
+        if len(header) < 12:
+            return None, stats
+        block_type = struct.unpack("<I", header[:4])[0]
+        if block_type != 0x0A0D0D0A:
+            return None, stats
+        bom = header[8:12]
+        if bom == b"\x4d\x3c\x2b\x1a":
+            endian = "<"
+        elif bom == b"\x1a\x2b\x3c\x4d":
+            endian = ">"
+        else:
+            return None, stats
+        block_hdr_struct = struct.Struct(endian + "II")
+        u16_struct = struct.Struct(endian + "H")
+        u32_struct = struct.Struct(endian + "I")
+        buf_len = len(buf)
+        offset = 0
+        while True:
+            if offset + 8 > buf_len:
+                break
+            btype, blen = block_hdr_struct.unpack_from(buf, offset)
+            if blen < 12:
+                break
+            body = buf[offset + 8:offset + blen]
+            if len(body) < blen - 8:
+                break
+            offset += blen
+            if btype == 0x00000001 and len(body) >= 8:  # Interface Description Block
+                stats["linktype"] = u16_struct.unpack_from(body, 0)[0]
+            if btype == 0x00000006:  # Enhanced Packet Block
+                if len(body) < 28:
+                    continue
+                cap_len = u32_struct.unpack_from(body, 12)[0]
+                packet_data = body[20:20 + cap_len]
+                stats["packets"] += 1
+                if stats["packets"] == 1:
+                    stats["first_packet_hex"] = packet_data[:64].hex()
+                dest_idx = packet_data.find(b"\x01\x00\x0c\xcc\xcc\xcc")
+                if dest_idx != -1:
+                    stats["dest_hits"] += 1
+                    if stats["first_dest_packet"] is None:
+                        stats["first_dest_packet"] = stats["packets"]
+                        stats["first_dest_offset"] = dest_idx
+                prefix_idx = packet_data.find(_SNAP_PREFIX)
+                if prefix_idx == -1:
+                    continue
+                snap_idx = packet_data.find(b"\xaa\xaa\x03\x00\x00\x0c\x20\x00", prefix_idx)
+                if snap_idx != -1:
+                    stats["snap_hits"] += 1
+                    if stats["first_snap_packet"] is None:
+                        stats["first_snap_packet"] = stats["packets"]
+                        stats["first_snap_offset"] = snap_idx
+                parsed = parse_cdp_at(packet_data, prefix_idx)
+                if parsed:
+                    if parsed.get("protocol") == "cdp":
+                        return parsed, stats
+                    if parsed.get("protocol") == "dtp" and first_dtp is None:
+                        first_dtp = parsed
+            elif btype == 0x00000003:  # Simple Packet Block
+                if len(body) < 8:
+                    continue
+                packet_data = body[4:-4]
+                stats["packets"] += 1
+                if stats["packets"] == 1:
+                    stats["first_packet_hex"] = packet_data[:64].hex()
+                dest_idx = packet_data.find(b"\x01\x00\x0c\xcc\xcc\xcc")
+                if dest_idx != -1:
+                    stats["dest_hits"] += 1
+                    if stats["first_dest_packet"] is None:
+                        stats["first_dest_packet"] = stats["packets"]
+                        stats["first_dest_offset"] = dest_idx
+                prefix_idx = packet_data.find(_SNAP_PREFIX)
+                if prefix_idx == -1:
+                    continue
+                snap_idx = packet_data.find(b"\xaa\xaa\x03\x00\x00\x0c\x20\x00", prefix_idx)
+                if snap_idx != -1:
+                    stats["snap_hits"] += 1
+                    if stats["first_snap_packet"] is None:
+                        stats["first_snap_packet"] = stats["packets"]
+                        stats["first_snap_offset"] = snap_idx
+                parsed = parse_cdp_at(packet_data, prefix_idx)
+                if parsed:
+                    if parsed.get("protocol") == "cdp":
+                        return parsed, stats
+                    if parsed.get("protocol") == "dtp" and first_dtp is None:
+                        first_dtp = parsed
     except Exception:
         return None, stats
     return first_dtp, stats
 
 
-def parse_cdp_from_pcap(path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
-    parsed, stats = _parse_pcap_raw(path)
+def _detect_format(magic: bytes) -> str:
+    if magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d", b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+        return "pcap"
+    if magic == b"\x0a\x0d\x0d\x0a":
+        return "pcapng"
+    return ""
+
+
+@contextlib.contextmanager
+def _map_capture(path: str):
+    """Map the capture file read-only; slices of the map are plain bytes."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def _analyze_capture(
+    source: Union[str, bytes],
+    patterns: List[bytes]
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any], Dict[bytes, Tuple[int, Optional[int], str]]]:
+    """Scan a capture (file path or raw bytes) for patterns and parse CDP/DTP from it in one pass."""
+    scan: Dict[bytes, Tuple[int, Optional[int], str]] = {pattern: (0, None, "") for pattern in patterns}
+    fmt = ""
+    in_memory = not isinstance(source, str)
+    try:
+        with (contextlib.nullcontext(source) if in_memory else _map_capture(source)) as data:
+            scan = _scan_bytes(data, patterns)
+            fmt = _detect_format(data[:4])
+            if fmt == "pcapng":
+                parsed, stats = _parse_pcapng_raw(data)
+            else:
+                parsed, stats = _parse_pcap_raw(data)
+    except Exception:
+        parsed, stats = _parse_pcap_raw(b"")
     if parsed and parsed.get("protocol") == "cdp":
-        return parsed, stats
-    parsed_ng, ng_stats = _parse_pcapng_raw(path)
-    if parsed_ng and parsed_ng.get("protocol") == "cdp":
-        return parsed_ng, ng_stats
+        return parsed, stats, scan
+    # scapy reads the same packets, so it only helps when the raw parser did not
+    # recognise the file or saw SNAP frames it could not decode.
+    if fmt and (parsed or not stats.get("snap_hits")):
+        return parsed, stats, scan
     try:
         from scapy.utils import PcapReader
     except Exception:
-        return parsed or parsed_ng, stats
+        return parsed, stats, scan
     try:
-        first_dtp = parsed or parsed_ng
-        with PcapReader(path) as reader:
+        first_dtp = parsed
+        with PcapReader(io.BytesIO(source) if in_memory else source) as reader:
             for pkt in reader:
                 payload = bytes(pkt)
                 parsed = parse_cdp(payload)
                 if parsed:
                     if parsed.get("protocol") == "cdp":
-                        return parsed, stats
+                        return parsed, stats, scan
                     if parsed.get("protocol") == "dtp" and not first_dtp:
                         first_dtp = parsed
     except Exception:
-        return None, stats
-    return first_dtp, stats
+        return None, stats, scan
+    return first_dtp, stats, scan
+
+
+def parse_cdp_from_pcap(path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    parsed, stats, _ = _analyze_capture(path, [])
+    return parsed, stats
+
 
+def _download_capture(resp: Any, out_path: str) -> Tuple[Optional[bytes], int]:
+    """Read a streamed capture into memory, spilling to out_path once it passes _MAX_MEMORY_CAPTURE.
 
-def _scan_file_bytes(path: str, pattern: bytes) -> Tuple[int, Optional[int], str]:
+    Returns (data, size); data is None when the capture was written to out_path.
+    """
+    chunks: List[bytes] = []
+    size = 0
+    f = None
     try:
-        with open(path, "rb") as f:
-            data = f.read()
-    except Exception:
-        return 0, None, ""
-    count = data.count(pattern)
-    if count == 0:
-        return 0, None, ""
-    first = data.find(pattern)
-    start = max(0, first - 16)
-    end = min(len(data), first + len(pattern) + 16)
-    snippet = data[start:end].hex()
-    return count, first, snippet
-
-
-def _collect_nic_names(payload: Any) -> List[str]:
+        for chunk in resp.iter_content(chunk_size=_DOWNLOAD_CHUNK):
+            size += len(chunk)
+            if f is not None:
+                f.write(chunk)
+                continue
+            chunks.append(chunk)
+            if size > _MAX_MEMORY_CAPTURE:
+                f = open(out_path, "wb")
+                f.writelines(chunks)
+                chunks = []
+    finally:
+        if f is not None:
+            f.close()
+    if f is not None:
+        return None, size
+    return b"".join(chunks), size
+
+
+def _scan_bytes(data: bytes, patterns: List[bytes]) -> Dict[bytes, Tuple[int, Optional[int], str]]:
+    """Count each pattern in data and hex-dump the bytes around its first hit."""
+    results: Dict[bytes, Tuple[int, Optional[int], str]] = {pattern: (0, None, "") for pattern in patterns}
+    counts: Dict[bytes, int] = {}
+    firsts: Dict[bytes, int] = {}
+    # The SNAP variants share a 7-byte prefix that cannot overlap itself, so one
+    # pass over the prefix counts all of them instead of one pass per variant.
+    snap_family = {p for p in patterns if len(p) == len(_SNAP_PREFIX) + 1 and p.startswith(_SNAP_PREFIX)}
+    if snap_family:
+        pos = data.find(_SNAP_PREFIX)
+        while pos != -1:
+            pattern = data[pos:pos + len(_SNAP_PREFIX) + 1]
+            if pattern in snap_family:
+                counts[pattern] = counts.get(pattern, 0) + 1
+                firsts.setdefault(pattern, pos)
+            pos = data.find(_SNAP_PREFIX, pos + len(_SNAP_PREFIX))
+    for pattern in patterns:
+        if pattern in snap_family:
+            continue
+        pos = data.find(pattern)
+        while pos != -1:
+            counts[pattern] = counts.get(pattern, 0) + 1
+            firsts.setdefault(pattern, pos)
+            pos = data.find(pattern, pos + len(pattern))
+    for pattern, first in firsts.items():
+        start = max(0, first - 16)
+        end = min(len(data), first + len(pattern) + 16)
+        results[pattern] = (counts[pattern], first, data[start:end].hex())
+    return results
+
+
+def _collect_nic_names(payload: Any) -> List[str]:
     names: List[str] = []
-    if isinstance(payload, dict):
-        for value in payload.values():
-            names.extend(_collect_nic_names(value))
-    elif isinstance(payload, list):
-        for item in payload:
-            names.extend(_collect_nic_names(item))
-    elif isinstance(payload, str):
-        if "NIC" in payload.upper():
-            names.append(payload)
-    return names
+    # Children are pushed reversed so strings come out in document order.
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, str):
+            if _NIC_RE.search(node):
+                names.append(node)
+    return names
 
 
 def _split_csv_values(value: Any) -> List[str]:
@@ -445,7 +601,77 @@ def _choose_nic_for_target(target_ip: str, pairs: List[Tuple[str, str]]) -> str:
     return ""
 
 
-def _find_or_create_switch(data: Dict[str, Any], site: str, cdp: Dict[str, Any], now: str) -> Optional[Dict[str, Any]]:
+class DeviceIndex:
+    """Devices keyed by MAC, IP and name/id, in database order.
+
+    Buckets may hold devices whose fields have since changed; lookups
+    re-check the live values, so callers only need to add() after an edit.
+    """
+
+    def __init__(self, devices: List[Dict[str, Any]]) -> None:
+        self._order: Dict[int, int] = {}
+        self._by_mac: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_ip: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_name: Dict[str, List[Dict[str, Any]]] = {}
+        for device in devices:
+            self.add(device)
+
+    def add(self, device: Dict[str, Any]) -> None:
+        self._order.setdefault(id(device), len(self._order))
+        keys = [
+            (self._by_mac, (device.get("mac") or "").lower()),
+            (self._by_ip, device.get("ip")),
+            (self._by_name, device.get("name")),
+            (self._by_name, device.get("id")),
+        ]
+        for index, key in keys:
+            if not key:
+                continue
+            bucket = index.setdefault(key, [])
+            if not any(d is device for d in bucket):
+                bucket.append(device)
+
+    def _first(self, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not candidates:
+            return None
+        return min(candidates, key=lambda d: self._order[id(d)])
+
+    def _mac_hits(self, mac: str) -> List[Dict[str, Any]]:
+        return [d for d in self._by_mac.get(mac, []) if (d.get("mac") or "").lower() == mac]
+
+    def _ip_hits(self, site: str, ip: str) -> List[Dict[str, Any]]:
+        return [d for d in self._by_ip.get(ip, []) if d.get("site") == site and d.get("ip") == ip]
+
+    def find_device(self, site: str, ip: str, mac: str) -> Optional[Dict[str, Any]]:
+        """First device with this IP in the site, or with this MAC in any site."""
+        candidates = self._ip_hits(site, ip)
+        if mac:
+            candidates.extend(self._mac_hits(mac))
+        return self._first(candidates)
+
+    def find_switch(self, site: str, mac: str, ip: Optional[str], name: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """First site device matching the MAC, IP or name/id, and which field matched."""
+        candidates: List[Dict[str, Any]] = []
+        if mac:
+            candidates.extend(d for d in self._mac_hits(mac) if d.get("site") == site)
+        if ip:
+            candidates.extend(self._ip_hits(site, ip))
+        if name:
+            candidates.extend(
+                d for d in self._by_name.get(name, [])
+                if d.get("site") == site and (d.get("name") == name or d.get("id") == name)
+            )
+        device = self._first(candidates)
+        if device is None:
+            return None, ""
+        if mac and (device.get("mac") or "").lower() == mac:
+            return device, "mac"
+        if ip and device.get("ip") == ip:
+            return device, "ip"
+        return device, "name"
+
+
+def _find_or_create_switch(data: Dict[str, Any], site: str, cdp: Dict[str, Any], now: str, index: DeviceIndex) -> Optional[Dict[str, Any]]:
     switch_ip = cdp.get("ip")
     switch_name = (cdp.get("device_id") or "").strip()
     switch_mac = (cdp.get("dtp_neighbor_mac") or cdp.get("mac") or cdp.get("switch_mac") or "").lower()
@@ -458,23 +684,12 @@ def _find_or_create_switch(data: Dict[str, Any], site: str, cdp: Dict[str, Any],
         platform = "Cisco (DTP)"
         vendor = "cisco"
 
-    match = None
-    match_reason = ""
-    for device in data.get("devices", []):
-        if device.get("site") != site:
-            continue
-        if has_mac and (device.get("mac") or "").lower() == switch_mac:
-            match = device
-            match_reason = "mac"
-            break
-        if has_ip and device.get("ip") == switch_ip:
-            match = device
-            match_reason = "ip"
-            break
-        if has_name and (device.get("name") == switch_name or device.get("id") == switch_name):
-            match = device
-            match_reason = "name"
-            break
+    match, match_reason = index.find_switch(
+        site,
+        switch_mac if has_mac else "",
+        switch_ip if has_ip else None,
+        switch_name if has_name else ""
+    )
     if match:
         if match.get("locked"):
             return match
@@ -499,6 +714,7 @@ def _find_or_create_switch(data: Dict[str, Any], site: str, cdp: Dict[str, Any],
         if updated:
             match["last_modified"] = now
             match["last_seen"] = now
+            index.add(match)
         return match
     if not has_name and not has_ip:
         return None
@@ -529,6 +745,7 @@ def _find_or_create_switch(data: Dict[str, Any], site: str, cdp: Dict[str, Any],
         "notes": "Placeholder from NVR capture"
     }
     data.setdefault("devices", []).append(new_device)
+    index.add(new_device)
     return new_device
 
 
@@ -635,7 +852,8 @@ def main() -> None:
 
     results = []
     failures = []
-    summary = {"cdp_ok": 0, "dtp_ok": 0, "no_cdp": 0, "switch_skipped": 0, "capture_fail": 0, "auth_fail": 0}
+    # Every key is seeded so the SUMMARY line can format(**summary) even when a counter stays at 0.
+    summary = Counter(cdp_ok=0, dtp_ok=0, no_cdp=0, switch_skipped=0, capture_fail=0, auth_fail=0)
 
     if log_file:
         try:
@@ -665,8 +883,9 @@ def main() -> None:
             return str(chal.get("nonce") or "")
 
         def _request_digest(method: str, url: str, *, headers: Optional[Dict[str, str]] = None,
-                            data: Any = None, timeout: int = 10, uri_override: Optional[str] = None):
-            return session.request(method, url, headers=headers, data=data, auth=auth, timeout=timeout)
+                            data: Any = None, timeout: int = 10, uri_override: Optional[str] = None,
+                            stream: bool = False):
+            return session.request(method, url, headers=headers, data=data, auth=auth, timeout=timeout, stream=stream)
 
         login_url = _url("/LAPI/V1.0/System/Security/Login")
         session.cookies.set("langInfo_", "1", domain=ip, path="/")
@@ -812,6 +1031,7 @@ def main() -> None:
                 _append_log(log_file, f"STOP EXISTING STATUS {ip} {stop_resp.status_code}")
                 if stop_resp.text:
                     _append_log(log_file, f"STOP EXISTING BODY {ip} {stop_resp.text[:300]}")
+                _flush_log(log_file)
                 time.sleep(2)
             except Exception as exc:
                 _append_log(log_file, f"STOP EXISTING ERROR {ip} {exc}")
@@ -839,6 +1059,7 @@ def main() -> None:
             now = time.time()
             wait_for = 10.0 - (now - last_start_ts)
             if wait_for > 0:
+                _flush_log(log_file)
                 time.sleep(wait_for)
             nic_candidates = [nic_value]
             if nic_value in ("eth0", "eth1"):
@@ -866,6 +1087,7 @@ def main() -> None:
                 return
             elapsed = time.time() - last_start_ts
             if elapsed < 10.0:
+                _flush_log(log_file)
                 time.sleep(10.0 - elapsed)
 
         out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "generated_maps", "nvr_captures")
@@ -881,6 +1103,9 @@ def main() -> None:
                 return ip, name, None, "start_fail"
 
             _append_log(log_file, f"CAPTURE {ip} running (attempt {attempt})...")
+            # Buffered lines only age out on the next append, so write them
+            # out before each wait or the live log stalls for the whole window.
+            _flush_log(log_file)
             time.sleep(capture_window_seconds)
 
             _append_log(log_file, f"STOP {ip}")
@@ -893,33 +1118,41 @@ def main() -> None:
                 pass
 
             _append_log(log_file, f"DOWNLOAD {ip}")
+            _flush_log(log_file)
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            safe_ip = ip.replace(".", "_")
+            out_path = os.path.join(out_dir, f"uniview_capture_{safe_ip}_{ts}_{attempt}.pcap")
             download_resp = _request_digest("GET", download_url, headers={
                 "Accept": "*/*",
                 "Referer": f"{base}/page/config.html"
-            }, timeout=30)
-            if download_resp.status_code != 200 or not download_resp.content:
+            }, timeout=30, stream=True)
+            try:
                 if download_resp.status_code != 200:
                     _append_log(log_file, f"DOWNLOAD FAIL {ip} {download_resp.status_code}")
                     if download_resp.text:
                         _append_log(log_file, f"DOWNLOAD BODY {ip} {download_resp.text[:500]}")
+                    _keepalive()
+                    continue
+                capture_data, size = _download_capture(download_resp, out_path)
+            finally:
+                download_resp.close()
+            if not size:
                 _keepalive()
                 continue
-
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_ip = ip.replace(".", "_")
-            out_path = os.path.join(out_dir, f"uniview_capture_{safe_ip}_{ts}_{attempt}.pcap")
-            with open(out_path, "wb") as f:
-                f.write(download_resp.content)
-            _append_log(log_file, f"SAVED {ip} {out_path}")
+            if capture_data is None:
+                _append_log(log_file, f"SAVED {ip} {out_path}")
+            else:
+                _append_log(log_file, f"DOWNLOADED {ip} {size} bytes")
 
             snap_pattern = b"\xaa\xaa\x03\x00\x00\x0c\x20\x00"
             snap_alt_pattern = b"\xaa\xaa\x03\x00\x00\x0c\x20\x02"
             snap_dtp_pattern = b"\xaa\xaa\x03\x00\x00\x0c\x20\x04"
             dest_pattern = b"\x01\x00\x0c\xcc\xcc\xcc"
-            snap_count, snap_offset, snap_snippet = _scan_file_bytes(out_path, snap_pattern)
-            snap_alt_count, snap_alt_offset, snap_alt_snippet = _scan_file_bytes(out_path, snap_alt_pattern)
-            snap_dtp_count, snap_dtp_offset, snap_dtp_snippet = _scan_file_bytes(out_path, snap_dtp_pattern)
-            dest_count, dest_offset, dest_snippet = _scan_file_bytes(out_path, dest_pattern)
+            cdp, stats, scan = _analyze_capture(out_path if capture_data is None else capture_data, [snap_pattern, snap_alt_pattern, snap_dtp_pattern, dest_pattern])
+            snap_count, snap_offset, snap_snippet = scan[snap_pattern]
+            snap_alt_count, snap_alt_offset, snap_alt_snippet = scan[snap_alt_pattern]
+            snap_dtp_count, snap_dtp_offset, snap_dtp_snippet = scan[snap_dtp_pattern]
+            dest_count, dest_offset, dest_snippet = scan[dest_pattern]
             if snap_count or snap_alt_count or snap_dtp_count or dest_count:
                 _append_log(
                     log_file,
@@ -934,7 +1167,6 @@ def main() -> None:
                     )
                 )
 
-            cdp, stats = parse_cdp_from_pcap(out_path)
             if not cdp:
                 _append_log(
                     log_file,
@@ -952,11 +1184,12 @@ def main() -> None:
             else:
                 _append_log(log_file, f"PARSED {ip}: {cdp}")
 
-            try:
-                os.remove(out_path)
-                _append_log(log_file, f"DELETED {out_path}")
-            except Exception:
-                pass
+            if capture_data is None:
+                try:
+                    os.remove(out_path)
+                    _append_log(log_file, f"DELETED {out_path}")
+                except Exception:
+                    pass
 
             if cdp:
                 return ip, name, cdp, "ok"
@@ -964,7 +1197,8 @@ def main() -> None:
         return ip, name, None, "no_cdp"
 
     updated = 0
-    with ThreadPoolExecutor(max_workers=len(devices)) as pool:
+    device_index = DeviceIndex(data.get("devices", []))
+    with ThreadPoolExecutor(max_workers=min(len(devices), MAX_CAPTURE_WORKERS)) as pool:
         future_map = {}
         for device in devices:
             ip = (device.get("ip") or "").strip()
@@ -974,6 +1208,8 @@ def main() -> None:
             future_map[pool.submit(capture_device, ip, name)] = device
 
         for future in as_completed(future_map):
+            # Write out whatever the finished capture logged before linking it.
+            _flush_log(log_file)
             try:
                 ip, name, cdp, reason = future.result()
             except Exception as exc:
@@ -984,22 +1220,12 @@ def main() -> None:
                 continue
 
             if cdp:
-                if cdp.get("protocol") == "cdp":
-                    summary["cdp_ok"] += 1
-                else:
-                    summary["dtp_ok"] += 1
+                summary["cdp_ok" if cdp.get("protocol") == "cdp" else "dtp_ok"] += 1
                 if data:
                     now = datetime.now().isoformat()
-                    dev_rec = None
                     device = future_map.get(future) or {}
                     incoming_mac = (device.get("mac") or "").lower()
-                    for d in data.get("devices", []):
-                        if d.get("site") == site_name and d.get("ip") == ip:
-                            dev_rec = d
-                            break
-                        if incoming_mac and (d.get("mac") or "").lower() == incoming_mac:
-                            dev_rec = d
-                            break
+                    dev_rec = device_index.find_device(site_name, ip, incoming_mac)
                     if dev_rec:
                         if dev_rec.get("locked"):
                             failures.append({"ip": ip, "name": name, "reason": "locked"})
@@ -1011,6 +1237,7 @@ def main() -> None:
                             dev_rec["mac"] = normalize_mac(incoming_mac)
                         if dev_rec.get("ip") != ip:
                             dev_rec["ip"] = ip
+                        device_index.add(dev_rec)
                         switch_name = (cdp.get("device_id") or "").strip()
                         switch_ip = (cdp.get("ip") or "").strip()
                         has_name = bool(switch_name) and not _is_mac_like(switch_name)
@@ -1025,7 +1252,7 @@ def main() -> None:
                             dev_rec["vlan"] = str(cdp["vlan"])
                         if cdp.get("platform"):
                             dev_rec["parent_switch_platform"] = cdp.get("platform")
-                        switch_device = _find_or_create_switch(data, site_name, cdp, now)
+                        switch_device = _find_or_create_switch(data, site_name, cdp, now, device_index)
                         if switch_device:
                             if not has_ip:
                                 dev_rec["parent_switch_ip"] = switch_device.get("ip") or dev_rec.get("parent_switch_ip")
@@ -1048,12 +1275,7 @@ def main() -> None:
                         updated += 1
                 results.append({"ip": ip, "name": name, "cdp_found": True})
             else:
-                if reason == "no_cdp":
-                    summary["no_cdp"] += 1
-                elif reason and ("login_fail_401" in reason or "login_fail_403" in reason):
-                    summary["auth_fail"] += 1
-                else:
-                    summary["capture_fail"] += 1
+                summary[_FAIL_REASON_COUNTERS.get(reason, "capture_fail")] += 1
                 failures.append({"ip": ip, "name": name, "reason": reason or "capture_failed"})
 
     if data and db_path:
@@ -1068,6 +1290,7 @@ def main() -> None:
         if failures:
             for failure in failures:
                 _append_log(log_file, f"FAIL {failure.get('ip')} {failure.get('reason')}")
+        _flush_log(log_file)
 
     print(json.dumps({"status": "success", "captures": results, "failures": failures, "updated_devices": updated}))
 
@@ -3,11 +3,13 @@
 Network Visualization Module - Generates interactive topology maps
 """
 
+import gzip
 import json
 import sys
 import os
 import uuid
 import shutil
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
 
@@ -15,20 +17,39 @@ MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 SHARED_DIR = os.path.abspath(os.path.join(MODULE_DIR, "..", "_shared"))
 if SHARED_DIR not in sys.path:
     sys.path.insert(0, SHARED_DIR)
-from sqlite_store import read_json_store
+from sqlite_store import dumps_json, read_json_store
+
+# Data files at least this large are written gzipped (<site>_data.json.gz).
+DATA_GZIP_MIN_BYTES = 1024 * 1024
+
+def _json_default(o):
+    """Encode the odd datetime/UUID field as it is met instead of cleaning the payload first"""
+    if isinstance(o, datetime):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+def _dumps(data) -> str:
+    """Compact JSON for the map payloads, encoded like the device store"""
+    return dumps_json(data, default=_json_default)
 
 def generate_network_map(database, site_name, output_dir="static/maps"):
     """
     Generate interactive HTML network map from database
-    Returns: (success, map_path_or_error)
+    Returns: (success, {"map_path", "devices_count", "connections_count"} or error)
     """
     
     try:
-        # Find devices for this site
-        site_devices = [
-            d for d in database.get("devices", []) 
-            if d.get("site") == site_name and not d.get("hide_from_map")
-        ]
+        # Find devices for this site; devices_count also includes the ones hidden from the map
+        site_devices = []
+        devices_count = 0
+        for d in database.get("devices", []):
+            if d.get("site") != site_name:
+                continue
+            devices_count += 1
+            if not d.get("hide_from_map"):
+                site_devices.append(d)
         
         if not site_devices:
             return False, f"No devices found for site '{site_name}'"
@@ -39,7 +60,6 @@ def generate_network_map(database, site_name, output_dir="static/maps"):
         # Prepare data for visualization
         devices_data = []
         connections_data = []
-        device_lookup = {}
         
         # Device type to color mapping
         type_colors = {
@@ -79,46 +99,34 @@ def generate_network_map(database, site_name, output_dir="static/maps"):
         }
 
         visible_device_ids = {device.get("id") for device in site_devices}
+        # One directory listing answers every "does this icon exist" check
+        try:
+            available_icons = {entry.name for entry in os.scandir(icons_dir)}
+        except OSError:
+            available_icons = set()
 
         # Process each device
         for device in site_devices:
-            device_id = device.get("id", f"dev_{uuid.uuid4().hex[:8]}")
+            # Only mint a random id for the rare record without one; a .get() default is built every time
+            device_id = device["id"] if "id" in device else f"dev_{uuid.uuid4().hex[:8]}"
             device_type = device.get("type", "unknown").lower()
             color = type_colors.get(device_type, '#073B4C')
 
             icon_name = icon_map.get(device_type, icon_map["unknown"])
-            icon_path = os.path.join(icons_dir, icon_name)
-            if os.path.exists(icon_path):
-                icon_url = f"{icon_web_base}/{icon_name}"
-            else:
-                icon_url = blank_icon
+            icon_url = f"{icon_web_base}/{icon_name}" if icon_name in available_icons else blank_icon
             
+            label = device.get("name", device.get("ip", "Unknown"))
             device_node = {
                 'id': device_id,
-                'label': device.get("name", device.get("ip", "Unknown")),
+                'label': label,
                 'title': f"""
-                <strong>{device.get('name', device.get('ip', 'Unknown'))}</strong><br>
+                <strong>{label}</strong><br>
                 IP: {device.get('ip', 'N/A')}<br>
                 Type: {device.get('type', 'Unknown')}<br>
                 Platform: {device.get('platform', 'N/A')}<br>
                 Status: {device.get('status', 'unknown')}
                 """,
-                'color': {
-                    'border': '#3B82F6',
-                    'background': '#DBEAFE',
-                    'highlight': {
-                        'border': '#F59E0B',
-                        'background': '#FEF3C7'
-                    },
-                    'hover': {
-                        'border': '#60A5FA',
-                        'background': '#E0F2FE'
-                    }
-                },
-                'shape': 'circularImage',
                 'image': icon_url,
-                'brokenImage': blank_icon,
-                'size': 36,
                 'data': {
                     'ip': device.get("ip"),
                     'type': device.get("type", "unknown"),
@@ -129,13 +137,12 @@ def generate_network_map(database, site_name, output_dir="static/maps"):
             }
             
             devices_data.append(device_node)
-            device_lookup[device["ip"]] = device_id
             
             # Process connections
             for conn in device.get("connections", []):
                 if 'remote_device' in conn and conn.get("remote_device") in visible_device_ids:
                     connection_edge = {
-                        'id': conn.get("id", f"conn_{uuid.uuid4().hex[:8]}"),
+                        'id': conn["id"] if "id" in conn else f"conn_{uuid.uuid4().hex[:8]}",
                         'from': device_id,
                         'to': conn['remote_device'],
                         'label': f"{conn.get('local_interface', '')} ↔ {conn.get('remote_interface', '')}",
@@ -146,49 +153,77 @@ def generate_network_map(database, site_name, output_dir="static/maps"):
                     }
                     connections_data.append(connection_edge)
         
-        # Generate HTML with vis.js
-        html_content = self._generate_html_template(
-            site_name=site_name,
-            devices_count=len(devices_data),
-            connections_count=len(connections_data),
-            devices_json=json.dumps(devices_data),
-            connections_json=json.dumps(connections_data)
-        )
+        # Edges per device, worked out once here instead of by scanning every edge on each click
+        edge_counts = Counter()
+        for edge in connections_data:
+            edge_counts[edge['from']] += 1
+            if edge['to'] != edge['from']:
+                edge_counts[edge['to']] += 1
+        for device_node in devices_data:
+            device_node['data']['connections_count'] = edge_counts[device_node['id']]
+        
+        # One clock read stamps both the map page and the data file
+        generated = datetime.now()
         
-        # Save map file
+        # Save map file, streamed straight from the static template parts
         map_filename = f"{site_name.lower().replace(' ', '_')}_map.html"
         map_path = os.path.join(output_dir, map_filename)
         
         with open(map_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+            _write_html_template(
+                f,
+                site_name=site_name,
+                devices_count=len(devices_data),
+                connections_count=len(connections_data),
+                devices_data=devices_data,
+                connections_data=connections_data,
+                generated=generated
+            )
         
         # Also create a simple JSON data file for API access
         data_path = os.path.join(output_dir, f"{site_name.lower().replace(' ', '_')}_data.json")
         map_data = {
             "site": site_name,
-            "generated": datetime.now().isoformat(),
+            "generated": generated.isoformat(),
             "devices": devices_data,
             "connections": connections_data,
             "map_url": f"/static/maps/{map_filename}"
         }
         
-        with open(data_path, 'w', encoding='utf-8') as f:
-            json.dump(map_data, f, indent=2)
-        
-        return True, map_path
+        # Encoded in one go: json.dump(f) or indent=2 would fall back to the pure-Python encoder.
+        data_json = _dumps(map_data)
+        if len(data_json) >= DATA_GZIP_MIN_BYTES:
+            with gzip.open(data_path + ".gz", 'wt', encoding='utf-8', compresslevel=1) as f:
+                f.write(data_json)
+            stale_path = data_path
+        else:
+            with open(data_path, 'w', encoding='utf-8') as f:
+                f.write(data_json)
+            stale_path = data_path + ".gz"
+        # Drop the other variant so a site never has both a fresh and an outdated data file
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+        
+        return True, {
+            "map_path": map_path,
+            "devices_count": devices_count,
+            "connections_count": len(connections_data)
+        }
         
     except Exception as e:
         return False, f"Error generating map: {str(e)}"
 
-def _generate_html_template(self, site_name, devices_count, connections_count, devices_json, connections_json):
-    """Generate complete HTML template with vis.js"""
-    return f"""
+# Static parts of the map page, kept as plain strings so only the per-site
+# values are interpolated when a map is written.
+_HTML_HEAD = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Network Map - {site_name}</title>
+    <title>Network Map - """
+
+_HTML_STYLE = """</title>
     
     <!-- Vis.js Network Library -->
     <script type="text/javascript" src="https://unpkg.com/vis-network/standalone/umd/vis-network.min.js"></script>
@@ -198,83 +233,83 @@ def _generate_html_template(self, site_name, devices_count, connections_count, d
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
     
     <style>
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
         
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             min-height: 100vh;
             padding: 20px;
-        }}
+        }
         
-        .container {{
+        .container {
             max-width: 1400px;
             margin: 0 auto;
             background: white;
             border-radius: 15px;
             overflow: hidden;
             box-shadow: 0 20px 60px rgba(0,0,0,0.3);
-        }}
+        }
         
-        .header {{
+        .header {
             background: linear-gradient(90deg, #4b6cb7 0%, #182848 100%);
             color: white;
             padding: 25px 30px;
-        }}
+        }
         
-        .header h1 {{
+        .header h1 {
             font-size: 28px;
             margin-bottom: 5px;
             display: flex;
             align-items: center;
             gap: 10px;
-        }}
+        }
         
-        .header h1 i {{
+        .header h1 i {
             color: #FFD700;
-        }}
+        }
         
-        .stats {{
+        .stats {
             display: flex;
             gap: 20px;
             margin-top: 15px;
             flex-wrap: wrap;
-        }}
+        }
         
-        .stat-box {{
+        .stat-box {
             background: rgba(255,255,255,0.1);
             padding: 10px 20px;
             border-radius: 8px;
             backdrop-filter: blur(10px);
-        }}
+        }
         
-        .visualization-area {{
+        .visualization-area {
             padding: 20px;
             height: 700px;
             border-bottom: 1px solid #eee;
-        }}
+        }
         
-        #network-container {{
+        #network-container {
             width: 100%;
             height: 100%;
             border: 1px solid #e0e0e0;
             border-radius: 10px;
             background: #f9f9f9;
-        }}
+        }
         
-        .controls {{
+        .controls {
             padding: 20px;
             display: flex;
             gap: 15px;
             background: #f8f9fa;
             border-bottom: 1px solid #e0e0e0;
-        }}
+        }
         
-        .btn {{
+        .btn {
             padding: 10px 20px;
             border: none;
             border-radius: 6px;
@@ -284,108 +319,99 @@ def _generate_html_template(self, site_name, devices_count, connections_count, d
             align-items: center;
             gap: 8px;
             transition: all 0.3s;
-        }}
+        }
         
-        .btn-primary {{
+        .btn-primary {
             background: #4b6cb7;
             color: white;
-        }}
+        }
         
-        .btn-primary:hover {{
+        .btn-primary:hover {
             background: #3a559f;
             transform: translateY(-2px);
-        }}
+        }
         
-        .legend {{
+        .legend {
             padding: 20px;
             display: flex;
             flex-wrap: wrap;
             gap: 15px;
             background: white;
-        }}
+        }
         
-        .legend-item {{
+        .legend-item {
             display: flex;
             align-items: center;
             gap: 8px;
-        }}
+        }
         
-        .legend-color {{
+        .legend-color {
             width: 20px;
             height: 20px;
             border-radius: 4px;
-        }}
+        }
         
-        .device-panel {{
+        .device-panel {
             padding: 20px;
             background: #f8f9fa;
             min-height: 200px;
             max-height: 300px;
             overflow-y: auto;
-        }}
+        }
         
-        .device-card {{
+        .device-card {
             background: white;
             padding: 15px;
             border-radius: 8px;
             margin-bottom: 10px;
             box-shadow: 0 2px 5px rgba(0,0,0,0.1);
             border-left: 4px solid #4b6cb7;
-        }}
+        }
         
-        .device-card h4 {{
+        .device-card h4 {
             color: #333;
             margin-bottom: 5px;
             display: flex;
             align-items: center;
             gap: 8px;
-        }}
+        }
         
-        .device-card p {{
+        .device-card p {
             color: #666;
             font-size: 14px;
             margin: 3px 0;
-        }}
+        }
         
-        .status-indicator {{
+        .status-indicator {
             display: inline-block;
             width: 10px;
             height: 10px;
             border-radius: 50%;
             margin-right: 5px;
-        }}
+        }
         
-        .status-up {{
+        .status-up {
             background: #28a745;
-        }}
+        }
         
-        .status-down {{
+        .status-down {
             background: #dc3545;
-        }}
+        }
         
-        .timestamp {{
+        .timestamp {
             color: #888;
             font-size: 12px;
             margin-top: 10px;
             text-align: right;
-        }}
+        }
     </style>
 </head>
 <body>
     <div class="container">
         <div class="header">
-            <h1><i class="fas fa-project-diagram"></i> Network Topology: {site_name}</h1>
-            <p>Interactive visualization of discovered network devices</p>
-            
-            <div class="stats">
-                <div class="stat-box">
-                    <i class="fas fa-server"></i> Devices: <strong>{devices_count}</strong>
-                </div>
-                <div class="stat-box">
-                    <i class="fas fa-link"></i> Connections: <strong>{connections_count}</strong>
-                </div>
-                <div class="stat-box">
-                    <i class="fas fa-sync-alt"></i> Updated: {datetime.now().strftime('%Y-%m-%d %H:%M')}
+            <h1><i class="fas fa-project-diagram"></i> Network Topology: """
+
+_HTML_PANELS = """
                 </div>
             </div>
         </div>
@@ -426,111 +452,137 @@ def _generate_html_template(self, site_name, devices_count, connections_count, d
         </div>
         
         <div class="timestamp">
-            Generated by CMapper Network Discovery System | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            Generated by CMapper Network Discovery System | """
+
+_HTML_SCRIPT_OPEN = """
         </div>
     </div>
 
     <script>
         // Initialize network data
-        const devices = new vis.DataSet({devices_json});
-        const connections = new vis.DataSet({connections_json});
+        const devices = new vis.DataSet("""
+
+_HTML_SCRIPT_MID = """);
+        const connections = new vis.DataSet("""
+
+_HTML_SCRIPT = """);
         
         // Network container
         const container = document.getElementById('network-container');
-        const data = {{
+        const data = {
             nodes: devices,
             edges: connections
-        }};
+        };
         
-        // Network options
-        const options = {{
-            nodes: {{
+"""
+
+# vis.js network options; the same for every site, so written out verbatim.
+# Node styling every device shares (shape, size, colours, brokenImage) is set
+# here once rather than repeated in each node of the devices payload.
+_VIS_OPTIONS_JS = """        // Network options
+        const options = {
+            nodes: {
                 shape: 'circularImage',
                 size: 36,
-                font: {{
+                brokenImage: 'data:image/gif;base64,R0lGODlhAQABAAD/ACwAAAAAAQABAAACADs=',
+                color: {
+                    border: '#3B82F6',
+                    background: '#DBEAFE',
+                    highlight: {
+                        border: '#F59E0B',
+                        background: '#FEF3C7'
+                    },
+                    hover: {
+                        border: '#60A5FA',
+                        background: '#E0F2FE'
+                    }
+                },
+                font: {
                     size: 14,
                     face: 'Segoe UI',
                     color: '#333'
-                }},
+                },
                 borderWidth: 2,
                 borderWidthSelected: 4,
                 shadow: true
-            }},
-            edges: {{
+            },
+            edges: {
                 width: 2,
-                color: {{
+                color: {
                     color: '#A0A0A0',
                     highlight: '#FF6B6B',
                     hover: '#4ECDC4'
-                }},
-                smooth: {{
+                },
+                smooth: {
                     type: 'dynamic',
                     roundness: 0.5
-                }},
-                arrows: {{
-                    to: {{ enabled: true, scaleFactor: 0.8 }}
-                }},
+                },
+                arrows: {
+                    to: { enabled: true, scaleFactor: 0.8 }
+                },
                 selectionWidth: 3,
                 hoverWidth: 2.5
-            }},
-            physics: {{
+            },
+            physics: {
                 enabled: true,
                 solver: 'forceAtlas2Based',
-                forceAtlas2Based: {{
+                forceAtlas2Based: {
                     gravitationalConstant: -100,
                     centralGravity: 0.01,
                     springLength: 200,
                     springConstant: 0.08,
                     damping: 0.4
-                }},
-                stabilization: {{
+                },
+                stabilization: {
                     enabled: true,
                     iterations: 1000,
                     updateInterval: 100
-                }}
-            }},
-            interaction: {{
+                }
+            },
+            interaction: {
                 hover: true,
                 tooltipDelay: 200,
                 hideEdgesOnDrag: false,
                 hideEdgesOnZoom: false,
                 zoomView: true,
                 dragView: true
-            }}
-        }};
-        
+            }
+        };
+"""
+
+_HTML_SCRIPT_EVENTS = """        
         // Create network
         const network = new vis.Network(container, data, options);
         
         // Device click handler
-        network.on('click', function(params) {{
-            if (params.nodes.length > 0) {{
+        network.on('click', function(params) {
+            if (params.nodes.length > 0) {
                 const nodeId = params.nodes[0];
                 const node = devices.get(nodeId);
-                const nodeData = node.data || {{}};
+                const nodeData = node.data || {};
                 
                 let html = `
                     <div class="device-card">
                         <h4>
-                            <i class="fas fa-{{getDeviceIcon(nodeData.type)}}"></i>
-                            ${{node.label}}
-                            <span class="status-indicator ${{nodeData.reachable ? 'status-up' : 'status-down'}}"></span>
+                            <i class="fas fa-{getDeviceIcon(nodeData.type)}"></i>
+                            ${node.label}
+                            <span class="status-indicator ${nodeData.reachable ? 'status-up' : 'status-down'}"></span>
                         </h4>
-                        <p><strong>IP Address:</strong> ${{nodeData.ip || 'N/A'}}</p>
-                        <p><strong>Device Type:</strong> ${{nodeData.type || 'Unknown'}}</p>
-                        <p><strong>Platform:</strong> ${{nodeData.platform || 'N/A'}}</p>
-                        <p><strong>Status:</strong> ${{nodeData.status || 'unknown'}}</p>
-                        <p><strong>Connections:</strong> ${{getConnectionCount(nodeId) || '0'}}</p>
+                        <p><strong>IP Address:</strong> ${nodeData.ip || 'N/A'}</p>
+                        <p><strong>Device Type:</strong> ${nodeData.type || 'Unknown'}</p>
+                        <p><strong>Platform:</strong> ${nodeData.platform || 'N/A'}</p>
+                        <p><strong>Status:</strong> ${nodeData.status || 'unknown'}</p>
+                        <p><strong>Connections:</strong> ${nodeData.connections_count || '0'}</p>
                     </div>
                 `;
                 
                 document.getElementById('device-details').innerHTML = html;
-            }}
-        }});
+            }
+        });
         
         // Helper functions
-        function getDeviceIcon(deviceType) {{
-            const icons = {{
+        function getDeviceIcon(deviceType) {
+            const icons = {
                 'router': 'server',
                 'switch': 'sitemap',
                 'firewall': 'shield-alt',
@@ -538,60 +590,83 @@ def _generate_html_template(self, site_name, devices_count, connections_count, d
                 'phone': 'phone',
                 'host': 'desktop',
                 'unknown': 'question-circle'
-            }};
+            };
             return icons[deviceType?.toLowerCase()] || 'question-circle';
-        }}
-        
-        function getConnectionCount(nodeId) {{
-            return connections.get({{
-                filter: function(edge) {{
-                    return edge.from === nodeId || edge.to === nodeId;
-                }}
-            }}).length;
-        }}
+        }
         
         // Control functions
         let physicsEnabled = true;
         
-        function togglePhysics() {{
+        function togglePhysics() {
             physicsEnabled = !physicsEnabled;
-            network.setOptions({{ physics: {{ enabled: physicsEnabled }} }});
+            network.setOptions({ physics: { enabled: physicsEnabled } });
             document.querySelector('[onclick="togglePhysics()"] i').className = 
                 physicsEnabled ? 'fas fa-magnet' : 'fas fa-ban';
-        }}
+        }
         
-        function downloadMap() {{
+        function downloadMap() {
             const canvas = document.querySelector('#network-container canvas');
-            if (canvas) {{
+            if (canvas) {
                 const link = document.createElement('a');
-                link.download = 'network-map-{site_name}-{datetime.now().strftime('%Y%m%d')}.png';
+                link.download = 'network-map-"""
+
+_HTML_TAIL = """.png';
                 link.href = canvas.toDataURL('image/png');
                 link.click();
-            }} else {{
+            } else {
                 alert('Canvas not found. Try again after map is fully loaded.');
-            }}
-        }}
+            }
+        }
         
-        function refreshMap() {{
-            if (confirm('Refresh map data from server?')) {{
+        function refreshMap() {
+            if (confirm('Refresh map data from server?')) {
                 window.location.reload();
-            }}
-        }}
+            }
+        }
         
         // Fit network when stabilized
-        network.on('stabilizationIterationsDone', function() {{
+        network.on('stabilizationIterationsDone', function() {
             network.fit();
-        }});
+        });
         
         // Add some animation on load
-        setTimeout(() => {{
+        setTimeout(() => {
             network.fit();
-        }}, 500);
+        }, 500);
     </script>
 </body>
 </html>
 """
 
+def _write_html_template(f, site_name, devices_count, connections_count, devices_data, connections_data, generated):
+    """Stream the complete vis.js HTML page into an open file"""
+    f.write(_HTML_HEAD)
+    f.write(site_name)
+    f.write(_HTML_STYLE)
+    f.write(f"""{site_name}</h1>
+            <p>Interactive visualization of discovered network devices</p>
+            
+            <div class="stats">
+                <div class="stat-box">
+                    <i class="fas fa-server"></i> Devices: <strong>{devices_count}</strong>
+                </div>
+                <div class="stat-box">
+                    <i class="fas fa-link"></i> Connections: <strong>{connections_count}</strong>
+                </div>
+                <div class="stat-box">
+                    <i class="fas fa-sync-alt"></i> Updated: {generated.strftime('%Y-%m-%d %H:%M')}""")
+    f.write(_HTML_PANELS)
+    f.write(generated.strftime('%Y-%m-%d %H:%M:%S'))
+    f.write(_HTML_SCRIPT_OPEN)
+    f.write(_dumps(devices_data))
+    f.write(_HTML_SCRIPT_MID)
+    f.write(_dumps(connections_data))
+    f.write(_HTML_SCRIPT)
+    f.write(_VIS_OPTIONS_JS)
+    f.write(_HTML_SCRIPT_EVENTS)
+    f.write(f"{site_name}-{generated.strftime('%Y%m%d')}")
+    f.write(_HTML_TAIL)
+
 def main():
     """Main entry point for the module"""
     try:
@@ -631,9 +706,9 @@ def main():
                 "status": "success",
                 "message": f"Network map generated for {site_name}",
                 "data": {
-                    "map_path": result,
-                    "map_url": f"/static/maps/{os.path.basename(result)}",
-                    "devices_count": len([d for d in database.get("devices", []) if d.get("site") == site_name])
+                    "map_path": result["map_path"],
+                    "map_url": f"/static/maps/{os.path.basename(result['map_path'])}",
+                    "devices_count": result["devices_count"]
                 }
             }
         else:
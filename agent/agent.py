@@ -56,7 +56,7 @@ def save_state(base_dir: str, state: dict) -> None:
     path = os.path.join(base_dir, STATE_FILE)
     try:
         with open(path, "w", encoding="utf-8") as f:
-            json.dump(state, f, indent=2)
+            f.write(json.dumps(state, indent=2))
     except Exception:
         pass
 